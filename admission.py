@@ -0,0 +1,98 @@
+import contextlib
+import time
+from collections import Counter, deque
+
+
+class Rejected(Exception):
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def to_dict(self):
+        return {'status': self.status, 'retry_after': self.retry_after, 'message': str(self)}
+
+
+class AdmissionController:
+    """Caps in-flight work, measured in output pixels, and splits it fairly between clients.
+
+    A request is refused with 503 when the node as a whole is full and with
+    429 when its client already holds more than an equal share of the
+    capacity among the clients currently being served or recently turned
+    away, so a busy client cannot keep newcomers out. An idle node always
+    admits one request, however large, so oversized inputs are slow rather
+    than impossible.
+    """
+
+    def __init__(self, capacity, min_retry_after=1, max_retry_after=60, window=30, waiting_ttl=5):
+        self.capacity = capacity
+        self.min_retry_after = min_retry_after
+        self.max_retry_after = max_retry_after
+        self.window = window
+        self.in_flight = 0
+        self.by_client = Counter()
+        self.rejected = Counter()
+        self.admitted = 0
+        self.completed = deque()
+        self.waiting_ttl = waiting_ttl
+        self.waiting = {}
+
+    def pixels_per_second(self):
+        cutoff = time.monotonic() - self.window
+        while self.completed and self.completed[0][0] < cutoff:
+            self.completed.popleft()
+        return sum(cost for _, cost in self.completed) / self.window
+
+    def retry_after(self, excess):
+        rate = self.pixels_per_second()
+        if not rate:
+            return self.min_retry_after
+        return int(min(self.max_retry_after, max(self.min_retry_after, round(excess / rate))))
+
+    def active_clients(self, client):
+        now = time.monotonic()
+        self.waiting = {c: t for c, t in self.waiting.items() if now - t < self.waiting_ttl}
+        return set(self.by_client) | set(self.waiting) | {client}
+
+    def acquire(self, client, cost):
+        if self.in_flight:
+            share = self.capacity / len(self.active_clients(client))
+            used = self.by_client[client]
+            if used and used + cost > share:
+                self.rejected[429] += 1
+                raise Rejected(429, f"Client {client} is over its share of capacity",
+                               self.retry_after(used + cost - share))
+            if self.in_flight + cost > self.capacity:
+                self.rejected[503] += 1
+                self.waiting[client] = time.monotonic()
+                raise Rejected(503, "Server is at capacity, retry later",
+                               self.retry_after(self.in_flight + cost - self.capacity))
+        self.waiting.pop(client, None)
+        self.in_flight += cost
+        self.by_client[client] += cost
+        self.admitted += 1
+
+    def release(self, client, cost):
+        self.in_flight -= cost
+        self.by_client[client] -= cost
+        if self.by_client[client] <= 0:
+            del self.by_client[client]
+        self.completed.append((time.monotonic(), cost))
+
+    @contextlib.contextmanager
+    def slot(self, client, cost):
+        self.acquire(client, cost)
+        try:
+            yield
+        finally:
+            self.release(client, cost)
+
+    def stats(self):
+        return {
+            'capacity_pixels': self.capacity,
+            'in_flight_pixels': self.in_flight,
+            'clients': dict(self.by_client),
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'pixels_per_second': self.pixels_per_second(),
+        }
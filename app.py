@@ -1,64 +1,533 @@
-from pydantic import BaseModel, Field
 from jarvislabs import App, Server, S3Handler
-import torch
-from PIL import Image
 import os
-from RealESRGAN import RealESRGAN
-from diffusers.utils import load_image
-from torchvision import transforms
-import subprocess
-import requests
-from io import BytesIO
+import asyncio
+import functools
+import importlib
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from fetch import ImageFetcher, FetchError
+from cache import ResultCache, file_digest
+from singleflight import SingleFlight
+from jobs import JobQueue, QueueFull
+from admission import AdmissionController, Rejected
+from encoding import OutputFormat
+from metrics import Metrics, configure_tracing
 
+# Everything that pulls in torch is imported by ESRGAN.load on a background
+# thread, so the server can bind while the model is still loading; methods
+# that need these modules import them locally once loading has finished.
+heavy_modules = ('torch', 'engine', 'tiling', 'batching', 'lanes', 'convert', 'weights', 'workers', 'upload')
 
 
 app = App("Real-ESRGAN")
 
+# If the memory-mapped copy written by weights.py exists next to it, it is
+# loaded instead so that every process on the node shares one copy.
 weight_file = "models/RealESRGAN_x4plus.pth"
+onnx_file = "models/RealESRGAN_x4plus.onnx"
+scale = 4
+
+# 0 picks the tile size from tile_memory_budget; images that fit in a single
+# tile skip tiling entirely, and micro-batches are capped at one tile's pixels.
+tile_size = int(os.environ.get("ESRGAN_TILE_SIZE", "0"))
+tile_overlap = int(os.environ.get("ESRGAN_TILE_OVERLAP", "16"))
+tile_memory_budget = int(os.environ.get("ESRGAN_TILE_MEMORY_MB", "1024")) * 1024 * 1024
+
+batch_max_size = int(os.environ.get("ESRGAN_BATCH_MAX_SIZE", "8"))
+batch_max_wait_ms = float(os.environ.get("ESRGAN_BATCH_MAX_WAIT_MS", "5"))
+batch_bucket = int(os.environ.get("ESRGAN_BATCH_BUCKET", "64"))
+
+# Blocking work never runs on the event loop: codecs get their own thread
+# pool and all forward passes share one lane per device.
+codec_workers = int(os.environ.get("ESRGAN_CODEC_WORKERS", str(os.cpu_count() or 1)))
+
+fetch_connect_timeout = float(os.environ.get("ESRGAN_FETCH_CONNECT_TIMEOUT", "5"))
+fetch_read_timeout = float(os.environ.get("ESRGAN_FETCH_READ_TIMEOUT", "30"))
+fetch_max_bytes = int(os.environ.get("ESRGAN_FETCH_MAX_MB", "64")) * 1024 * 1024
+fetch_per_host = int(os.environ.get("ESRGAN_FETCH_PER_HOST", "16"))
+# Checked against the image header as soon as it has been downloaded, before
+# the rest of the body; an empty ESRGAN_FETCH_FORMATS accepts anything PIL reads.
+fetch_max_megapixels = float(os.environ.get("ESRGAN_FETCH_MAX_MP", "16"))
+fetch_formats = [f for f in os.environ.get("ESRGAN_FETCH_FORMATS", "PNG,JPEG,WEBP,BMP,GIF").split(",") if f]
+
+# Results are keyed on decoded pixels + model/scale/weights. An empty
+# ESRGAN_CACHE_DIR keeps the cache in memory only.
+weights_version = os.environ.get("ESRGAN_WEIGHTS_VERSION")
+cache_memory_items = int(os.environ.get("ESRGAN_CACHE_MEMORY_ITEMS", "10000"))
+cache_dir = os.environ.get("ESRGAN_CACHE_DIR", "cache")
+cache_disk_bytes = int(os.environ.get("ESRGAN_CACHE_DISK_MB", "256")) * 1024 * 1024
+
+# fp32, fp16 or bf16. With a minimum PSNR set, setup checks the reduced
+# precision against fp32 on the bundled samples and falls back if it is worse.
+precision = os.environ.get("ESRGAN_PRECISION", "fp32")
+channels_last = os.environ.get("ESRGAN_CHANNELS_LAST", "0") == "1"
+precision_min_psnr = float(os.environ.get("ESRGAN_PRECISION_MIN_PSNR", "0"))
+
+# eager, compile (torch.compile) or trace (TorchScript). Compiled graphs are
+# bucketed like the batcher; setup warms up each listed size before returning.
+compile_mode = os.environ.get("ESRGAN_COMPILE", "eager")
+compile_max_graphs = int(os.environ.get("ESRGAN_COMPILE_MAX_GRAPHS", "16"))
+# torch, onnx or int8. The ONNX graph is exported from weight_file on first
+# start if onnx_file does not exist yet; 0 threads lets ONNX Runtime decide.
+# The int8 model has to be built beforehand with quantize.py.
+backend = os.environ.get("ESRGAN_BACKEND", "torch")
+onnx_intra_threads = int(os.environ.get("ESRGAN_ONNX_INTRA_THREADS", "0"))
+onnx_inter_threads = int(os.environ.get("ESRGAN_ONNX_INTER_THREADS", "0"))
+
+# With more than one worker process each worker loads the model itself (from
+# the mapped weights, so the pages are shared) and is pinned to its own slice
+# of cores (CPU only).
+worker_processes = int(os.environ.get("ESRGAN_WORKERS", "1"))
+worker_threads = int(os.environ.get("ESRGAN_WORKER_THREADS", "0"))
+
+# Background jobs for inputs too large to finish within the load balancer's
+# request timeout; clients poll job_status or pass a webhook.
+job_queue_depth = int(os.environ.get("ESRGAN_JOB_QUEUE_DEPTH", "100"))
+job_concurrency = int(os.environ.get("ESRGAN_JOB_CONCURRENCY", "2"))
+job_retention = float(os.environ.get("ESRGAN_JOB_RETENTION_S", "3600"))
+
+# In-flight predict work is capped by output pixels and shared equally between
+# the clients that are currently active; jobs have their own queue instead.
+admission_max_megapixels = float(os.environ.get("ESRGAN_ADMISSION_MAX_MP", "64"))
+
+# With a bucket configured, outputs are encoded straight into concurrent S3
+# multipart uploads; ESRGAN_S3_ENDPOINT points at MinIO/moto for local runs.
+# Without one, uploads go through the jarvislabs S3Handler.
+s3_bucket = os.environ.get("ESRGAN_S3_BUCKET")
+s3_prefix = os.environ.get("ESRGAN_S3_PREFIX", "esrgan/")
+s3_endpoint = os.environ.get("ESRGAN_S3_ENDPOINT")
+s3_region = os.environ.get("ESRGAN_S3_REGION")
+s3_public_url = os.environ.get("ESRGAN_S3_PUBLIC_URL")
+s3_part_mb = int(os.environ.get("ESRGAN_S3_PART_MB", "8"))
+s3_concurrency = int(os.environ.get("ESRGAN_S3_CONCURRENCY", "8"))
+
+# Defaults for the per-request output options of predict. Encoding runs on
+# its own pool so long encodes do not hold up decoding of new requests.
+output_format = os.environ.get("ESRGAN_OUTPUT_FORMAT", "png")
+output_quality = os.environ.get("ESRGAN_OUTPUT_QUALITY")
+output_compression = os.environ.get("ESRGAN_OUTPUT_COMPRESSION")
+encode_workers = int(os.environ.get("ESRGAN_ENCODE_WORKERS", str(os.cpu_count() or 1)))
+encoder_threads = int(os.environ.get("ESRGAN_ENCODER_THREADS", "0"))
+
+# predict_batch: URLs accepted per call and items processed at once per call.
+bulk_max_urls = int(os.environ.get("ESRGAN_BULK_MAX_URLS", "1000"))
+bulk_concurrency = int(os.environ.get("ESRGAN_BULK_CONCURRENCY", "16"))
+
+# Prometheus scrapes /metrics on its own port (0 turns it off); api endpoints
+# answer with JSON, which Prometheus cannot read. With a trace endpoint (an
+# OTLP/HTTP collector, e.g. http://localhost:4318/v1/traces) every predict
+# call is also exported as a trace with one span per stage.
+metrics_port = int(os.environ.get("ESRGAN_METRICS_PORT", "9464"))
+trace_endpoint = os.environ.get("ESRGAN_TRACE_ENDPOINT")
+
+warmup_sizes = [int(s) for s in os.environ.get("ESRGAN_WARMUP_SIZES", "64,128,256").split(",") if s]
+# Inputs are routed by pixel count, read from the image header, to a small or
+# a large lane; each lane has its own inference threads and batching policy
+# (the ESRGAN_BATCH_* settings above are the small lane's).
+lane_split_megapixels = float(os.environ.get("ESRGAN_LANE_SPLIT_MP", "0.25"))
+small_lane_workers = int(os.environ.get("ESRGAN_SMALL_LANE_WORKERS", str(worker_processes)))
+large_lane_workers = int(os.environ.get("ESRGAN_LARGE_LANE_WORKERS", "1"))
+large_lane_batch_max_size = int(os.environ.get("ESRGAN_LARGE_LANE_BATCH_MAX_SIZE", "1"))
+large_lane_batch_max_wait_ms = float(os.environ.get("ESRGAN_LARGE_LANE_BATCH_MAX_WAIT_MS", "0"))
+# Intra-op threads for each forward pass of an in-process CPU engine; 0 uses
+# every core, so a lone request runs at full speed but calls from both lanes
+# at once oversubscribe the machine. Set it to cores / lane threads to keep
+# concurrent calls apart at the cost of slower single requests.
+cpu_threads = int(os.environ.get("ESRGAN_CPU_THREADS", "0"))
+
+# Seconds a predict call is told to wait before retrying while the model loads.
+loading_retry_after = int(os.environ.get("ESRGAN_LOADING_RETRY_AFTER", "5"))
+
+
+def to_rgb(image):
+    return image if image.mode == 'RGB' else image.convert('RGB')
 
-def open_image_from_url(url):
-    response = requests.get(url)
-    if response.status_code == 200:
-        image = Image.open(BytesIO(response.content))
-        return image
-    return None
 
 @app
 class ESRGAN:
     @app.setup
     def setup(self):
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.realesrgan = RealESRGAN(device, scale=4)
-        
-        if not os.path.isfile(weight_file):
-            raise FileNotFoundError(f"Model weights not found at {weight_file}")
+        # Only cheap state is built here; the model is loaded by `load` in the
+        # background and `loader` completes once it is ready to serve.
+        self.started = time.perf_counter()
+        self.import_seconds = {}
+        self.codec_pool = ThreadPoolExecutor(codec_workers, thread_name_prefix='codec')
+        self.encode_pool = ThreadPoolExecutor(encode_workers, thread_name_prefix='encode')
+        self.fetcher = ImageFetcher(
+            fetch_connect_timeout, fetch_read_timeout, fetch_max_bytes,
+            per_host=fetch_per_host, executor=self.codec_pool,
+            max_pixels=int(fetch_max_megapixels * 1e6), formats=fetch_formats,
+        )
+        self.flights = SingleFlight()
+        self.headers = {}
+        self.waiting = Counter()
+        self.s3 = S3Handler()
+        self.uploader = None
+        self.admission = AdmissionController(int(admission_max_megapixels * 1e6))
+        self.jobs = JobQueue(self.run, job_queue_depth, job_concurrency, job_retention)
+        self.telemetry = Metrics(configure_tracing(trace_endpoint) if trace_endpoint else None)
+        self.telemetry.watch(
+            fetch=self.fetcher.stats, single_flight=self.flights.stats,
+            jobs=self.jobs.stats, admission=self.admission.stats,
+        )
+        if metrics_port:
+            self.telemetry.serve(metrics_port)
+        self.loader = ThreadPoolExecutor(1, thread_name_prefix='load').submit(self.load)
+        self.loader.add_done_callback(self.report_load)
+
+    def report_load(self, loader):
+        if loader.exception() is not None:
+            print(f"Error: model load failed: {loader.exception()}")
+
+    def unloaded(self):
+        # why the model cannot serve yet, or None once it is loaded
+        if not self.loader.done():
+            return "Model is still loading"
+        if self.loader.exception() is not None:
+            return f"Model load failed: {self.loader.exception()}"
+
+    def import_heavy_modules(self):
+        for name in heavy_modules:
+            start = time.perf_counter()
+            importlib.import_module(name)
+            self.import_seconds[name] = time.perf_counter() - start
+        print("Imported " + ", ".join(f"{name} in {seconds:.2f}s" for name, seconds in self.import_seconds.items()))
+
+    def load(self):
+        self.import_heavy_modules()
+        import torch
+        from tiling import tile_for_budget
+        from lanes import Lane, Router
+        from weights import ensure_mapped, mapped_path
+        from workers import WorkerPool
+        from upload import Uploader
+
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.tile = tile_size or tile_for_budget(tile_memory_budget, scale)
+        # compiled graphs run every input padded up to the bucket and every
+        # batch up to a power of two; tiles and batches are sized so that
+        # padding never takes them past the budget
+        padded = backend == 'torch' and compile_mode != 'eager'
+        if padded:
+            self.tile = max(batch_bucket, self.tile - self.tile % batch_bucket)
+        if worker_processes > 1 and backend == 'torch':
+            # workers each load the model; from the mapped file its pages are
+            # shared between them instead of copied into every process
+            ensure_mapped(weight_file)
+        make_engine = self.load_engine()
+        if worker_processes > 1:
+            if self.device.type != 'cpu':
+                raise ValueError("ESRGAN_WORKERS > 1 is only supported on CPU")
+            self.engine = WorkerPool(make_engine, worker_processes, worker_threads)
+        else:
+            self.engine = make_engine()
+
+        loaded_file = mapped_path(weight_file) if os.path.isfile(mapped_path(weight_file)) else weight_file
+        version = weights_version or file_digest(loaded_file)[:16]
+        model_tag = f"RealESRGAN-x{scale}-{version}-{backend}-{self.engine.precision}"
+        self.cache = ResultCache(model_tag, cache_memory_items, cache_dir, cache_disk_bytes)
+        if s3_bucket:
+            self.uploader = Uploader(
+                s3_bucket, s3_prefix, s3_endpoint, s3_region, s3_public_url,
+                s3_part_mb * 1024 * 1024, s3_concurrency,
+            )
+
+        # The lanes run side by side. On a GPU they take turns on the device;
+        # on the CPU an in-process engine uses cpu_threads per call (worker
+        # processes and ONNX Runtime size their own thread pools).
+        device_lock = threading.Lock() if self.device.type == 'cuda' else None
+        if self.device.type == 'cpu' and worker_processes == 1 and backend != 'onnx':
+            torch.set_num_threads(cpu_threads or len(os.sched_getaffinity(0)))
+        self.router = Router(
+            Lane('small', self.engine, scale, self.tile, tile_overlap, small_lane_workers,
+                 batch_max_size, batch_max_wait_ms, batch_bucket,
+                 device_lock=device_lock, pow2_batches=padded),
+            Lane('large', self.engine, scale, self.tile, tile_overlap, large_lane_workers,
+                 large_lane_batch_max_size, large_lane_batch_max_wait_ms, batch_bucket,
+                 device_lock=device_lock, pow2_batches=padded),
+            int(lane_split_megapixels * 1e6),
+        )
+
+        self.telemetry.watch(
+            cache=self.cache.stats, lane_small=self.router.small.stats, lane_large=self.router.large.stats
+        )
+        if self.uploader is not None:
+            self.telemetry.watch(upload=self.uploader.stats)
+
+        # each size at batch 1 and at the largest batch a lane forms for it;
+        # at the tile size that is a single image
+        sizes = sorted({min(size, self.tile) for size in warmup_sizes} | {self.tile})
+        shapes = sorted({
+            (n, size) for size in sizes for lane in self.router.lanes for n in (1, lane.batcher.batch_limit(size, size))
+        })
+        self.warmup_seconds = self.engine.warmup(shapes)
+        print(f"Warmed up {self.engine.describe()} on {shapes} in {self.warmup_seconds:.1f}s")
+        self.load_seconds = time.perf_counter() - self.started
+        print(f"Ready {self.load_seconds:.1f}s after setup")
+
+    def load_engine(self):
+        # Returns a factory for the engine. Worker processes unpickle it and
+        # load their own weights, so it must not close over anything.
+        from engine import Engine, build_engine, load_model
+        if backend == 'onnx':
+            from onnx_backend import OnnxEngine, export_onnx
+            if not os.path.isfile(onnx_file):
+                export_onnx(load_model(self.device, weight_file, scale), onnx_file)
+            return functools.partial(OnnxEngine, onnx_file, scale, onnx_intra_threads, onnx_inter_threads)
+        if backend == 'int8':
+            from engine import QuantizedEngine, quantized_path
+            quantized_file = quantized_path(weight_file)
+            if not os.path.isfile(quantized_file):
+                raise FileNotFoundError(f"Quantized model not found at {quantized_file}, build it with quantize.py")
+            return functools.partial(QuantizedEngine, quantized_file, scale)
+        self.realesrgan = load_model(self.device, weight_file, scale)
+        engine = Engine(self.realesrgan, precision, channels_last, compile_mode, batch_bucket, compile_max_graphs)
+        if precision_min_psnr and engine.precision != 'fp32':
+            engine = self.check_precision(engine)
+        if worker_processes > 1:
+            # workers use the precision that passed the check here
+            return functools.partial(
+                build_engine, weight_file, scale, engine.precision,
+                channels_last, compile_mode, batch_bucket, compile_max_graphs,
+            )
+        return lambda: engine
+
+    def check_precision(self, engine):
+        from engine import Engine, load_reference, accuracy_report
+        report = accuracy_report(engine, Engine(self.realesrgan), load_reference())
+        worst = min(r['psnr'] for r in report.values())
+        if worst >= precision_min_psnr:
+            return engine
+        print(f"{engine.precision} PSNR {worst:.2f} dB is below {precision_min_psnr} dB, using fp32")
+        return Engine(self.realesrgan, 'fp32', channels_last, compile_mode, batch_bucket, compile_max_graphs)
+
+    async def upscale(self, image_tensor, lane=None):
+        _, _, height, width = image_tensor.shape
+        lane = lane or self.router.lane_for(width, height)
+        return await lane.upscale(image_tensor)
+
+    def resolve_output(self, format=None, quality=None, lossless=False, compression=None):
+        if quality is None and output_quality:
+            quality = int(output_quality)
+        if compression is None and output_compression:
+            compression = int(output_compression)
+        output = OutputFormat(format or output_format, quality, lossless, compression, encoder_threads)
+        if self.uploader is None and output.tag() != OutputFormat().tag():
+            raise ValueError("Output format options need ESRGAN_S3_BUCKET; S3Handler picks its own encoding")
+        return output
+
+    async def process(self, url, output, header):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        lanes = []
 
-        self.realesrgan.load_weights(weight_file)
+        def classify(image):
+            lanes.append(self.router.lane_for(*image.size))
+            header.set_result(image.size)
+
+        # the lane is picked and admission reserved from the header, before
+        # the pixels are decoded; the fetcher decodes while it downloads, so
+        # 'fetch' covers both
+        with self.telemetry.stage('fetch'):
+            image = await self.fetcher.fetch(url, on_header=classify)
+        if not header.done():
+            header.set_result(image.size)
+        lane = lanes[0] if lanes else self.router.lane_for(*image.size)
+        with self.telemetry.stage('to_rgb'):
+            image = await loop.run_in_executor(self.codec_pool, to_rgb, image)
+
+        output = output or self.resolve_output()
+        with self.telemetry.stage('cache_lookup'):
+            key = await loop.run_in_executor(self.codec_pool, self.cache.key, image, output.tag())
+            cached = await loop.run_in_executor(self.codec_pool, self.cache.get, key)
+        if cached is not None:
+            return cached
+
+        # the same pixels can arrive under different URLs at the same time
+        with lane.request(started):
+            return await self.flights.do(('content', key), lambda: self.render(image, key, output, lane))
+
+    async def render(self, image, key, output, lane):
+        from convert import image_to_tensor, tensor_to_image
+        loop = asyncio.get_running_loop()
+        with self.telemetry.stage('to_tensor'):
+            image_tensor = await loop.run_in_executor(
+                self.codec_pool, image_to_tensor, image, self.device.type == 'cuda'
+            )
+
+        with self.telemetry.stage('inference', width=image.width, height=image.height):
+            sr_image_tensor = await self.upscale(image_tensor, lane)
+
+        with self.telemetry.stage('to_image'):
+            sr_image = await loop.run_in_executor(self.codec_pool, tensor_to_image, sr_image_tensor)
+        self.telemetry.megapixels.inc(sr_image.width * sr_image.height / 1e6)
+
+        # encoding streams straight into the upload, so they are timed together
+        with self.telemetry.stage('upload'):
+            if self.uploader is not None:
+                upload_url = [await loop.run_in_executor(self.encode_pool, self.uploader.upload_image, sr_image, output)]
+            else:
+                upload_url = await self.s3.upload_images([sr_image])
+        await loop.run_in_executor(self.codec_pool, self.cache.put, key, upload_url)
+        return upload_url
+
+    async def run(self, url, client=None, output=None):
+        await asyncio.wrap_future(self.loader)
+        output = output or self.resolve_output()
+        key = ('url', url, output.tag())
+        # `header` resolves to the input size once the flight has parsed it
+        created = key not in self.headers
+        header = self.headers.setdefault(key, asyncio.get_running_loop().create_future())
+        task = self.flights.start(key, lambda: self.process(url, output, header))
+        if created:
+            task.add_done_callback(lambda _: self._forget_header(key, header))
+        self.waiting[key] += 1
+        try:
+            return await self.admit(client, header, task)
+        except Rejected:
+            # nobody else wants it: stop the download instead of doing unpaid work
+            if self.waiting[key] == 1:
+                self._forget_header(key, header)
+                self.flights.cancel(key, task)
+            raise
+        finally:
+            self.waiting[key] -= 1
+            if not self.waiting[key]:
+                del self.waiting[key]
+
+    def _forget_header(self, key, header):
+        if self.headers.get(key) is header:
+            del self.headers[key]
+
+    async def admit(self, client, header, task):
+        # Every caller, including one joining a flight, is admitted against
+        # its own client's share as soon as the size is known. Jobs (no
+        # client) are never turned away.
+        if client is not None:
+            await asyncio.wait([header, task], return_when=asyncio.FIRST_COMPLETED)
+        if client is None or not header.done():
+            return await asyncio.shield(task)
+        width, height = header.result()
+        with self.admission.slot(client, width * height * scale * scale):
+            return await asyncio.shield(task)
+
+    async def respond(self, url, client=None, **options):
+        with self.telemetry.stage('predict', url=url):
+            try:
+                if not self.loader.done():
+                    raise Rejected(503, "Model is still loading", loading_retry_after)
+                if self.loader.exception() is not None:
+                    raise Rejected(503, self.unloaded(), None)
+                output = self.resolve_output(**options)
+                upload_url = await self.run(url, client or 'anonymous', output)
+                self.telemetry.requests.labels('ok').inc()
+
+                return {'images': upload_url}
+
+            except Rejected as e:
+                self.telemetry.requests.labels('rejected').inc()
+                return {"error": str(e), "status": e.status, "retry_after": e.retry_after}
+
+            except FetchError as e:
+                print(f"Error: {e}")
+                self.telemetry.requests.labels(f'fetch_{e.code}').inc()
+                return {"error": f"Image download failed: {str(e)}", "fetch": e.to_dict()}
+
+            except Exception as e:
+                print(f"Error: {e}")
+                self.telemetry.requests.labels('error').inc()
+                return {"error": f"Image generation failed: {str(e)}"}
 
     @app.api_endpoint
-    async def predict(self, url: str):
+    async def predict(self, url: str, client: str = None, format: str = None, quality: int = None,
+                      lossless: bool = False, compression: int = None):
+        return await self.respond(
+            url, client, format=format, quality=quality, lossless=lossless, compression=compression
+        )
+
+    @app.api_endpoint
+    async def predict_batch(self, urls: list, client: str = None, format: str = None, quality: int = None,
+                            lossless: bool = False, compression: int = None):
+        # jarvislabs endpoints answer with one JSON body, so the batch is
+        # collected rather than streamed: `results` follows the order of
+        # `urls`, each entry with either `images` or `error`.
+        if len(urls) > bulk_max_urls:
+            return {"error": f"At most {bulk_max_urls} URLs per batch, got {len(urls)}"}
+        options = dict(format=format, quality=quality, lossless=lossless, compression=compression)
+        slots = asyncio.Semaphore(bulk_concurrency)
+
+        async def item(index, url):
+            async with slots:
+                return {'index': index, 'url': url, **await self.respond(url, client, **options)}
+
+        return {"results": await asyncio.gather(*(item(i, url) for i, url in enumerate(urls)))}
+
+    @app.api_endpoint
+    async def live(self):
+        # Answering at all shows the event loop is running; the lag is how
+        # late a callback scheduled right now gets to run.
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.sleep(0)
+        return {"alive": True, "loop_lag_ms": (loop.time() - start) * 1000}
+
+    @app.api_endpoint
+    async def ready(self):
+        # Ready only once the weights are loaded and the warmup forward passes
+        # (including any compilation) have finished.
+        status = {"backend": backend, "import_seconds": self.import_seconds}
+        if not self.loader.done():
+            return {"ready": False, "status": 503, "state": "loading",
+                    "loading_seconds": time.perf_counter() - self.started, **status}
+        if self.loader.exception() is not None:
+            return {"ready": False, "status": 503, "state": "failed", "error": str(self.loader.exception()), **status}
+        return {
+            "ready": True, "status": 200, "state": "ready",
+            "device": str(self.device), "precision": self.engine.precision,
+            "load_seconds": self.load_seconds, "warmup_seconds": self.warmup_seconds, **status,
+        }
+
+    @app.api_endpoint
+    async def submit(self, url: str, webhook: str = None):
         try:
-            #image = load_image(url).convert('RGB')  # Ensure it's in RGB format
-            image = open_image_from_url(url).convert('RGB')
+            return self.jobs.submit(url, webhook)
+        except QueueFull as e:
+            return {"error": str(e), **self.jobs.stats()}
 
-            
-            transform = transforms.ToTensor()
-            image_tensor = transform(image).unsqueeze(0)  # Add batch dimension
+    @app.api_endpoint
+    async def job_status(self, job_id: str):
+        status = self.jobs.status(job_id)
+        if status is None:
+            return {"error": f"Unknown job {job_id}"}
+        return status
 
-            with torch.no_grad():
-                sr_image_tensor = self.realesrgan.predict(image_tensor)  the appropriate method
-            
-            sr_image = transforms.ToPILImage()(sr_image_tensor.squeeze(0)) 
+    @app.api_endpoint
+    async def queue_stats(self):
+        return {**self.jobs.stats(), 'admission': self.admission.stats()}
 
-            s3 = S3Handler()
-            upload_url = await s3.upload_images([sr_image])
+    @app.api_endpoint
+    async def batch_stats(self):
+        if self.unloaded() is not None:
+            return {"error": self.unloaded(), "status": 503}
+        return {lane.name: lane.batcher.stats() for lane in self.router.lanes}
 
-            return {'images': upload_url}
+    @app.api_endpoint
+    async def lane_stats(self):
+        if self.unloaded() is not None:
+            return {"error": self.unloaded(), "status": 503}
+        return self.router.stats()
 
-        except Exception as e:
-            print(f"Error: {e}")
-            return {"error": f"Image generation failed: {str(e)}"}
+    @app.api_endpoint
+    async def cache_stats(self):
+        if self.unloaded() is not None:
+            return {"error": self.unloaded(), "status": 503}
+        return {**self.cache.stats(), 'single_flight': self.flights.stats()}
 
 server = Server(app)
-server.run()
+
+# bulk.py imports this module to reuse ESRGAN without starting the server
+if __name__ == "__main__":
+    server.run()
 
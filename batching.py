@@ -0,0 +1,107 @@
+import asyncio
+from collections import Counter
+
+import torch
+import torch.nn.functional as F
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-image requests into batched forward passes.
+
+    Inputs are grouped by size rounded up to a multiple of `bucket` so that
+    images of similar size share a batch; within a batch each input is padded
+    only to the largest height and width present, and a lone input runs
+    unpadded. Each caller gets back its own crop of the output.
+    With `max_batch_pixels` set, a batch never holds more input pixels than
+    that, so batching cannot exceed the memory a single tile is sized for;
+    with `pow2_batches`, for an engine that pads every batch up to a power of
+    two, batch sizes are kept to powers of two as well.
+    """
+
+    def __init__(self, run_batch, scale, max_batch_size=8, max_wait_ms=5, bucket=64, executor=None,
+                 max_batch_pixels=None, pow2_batches=False):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.scale = scale
+        self.max_batch_size = max_batch_size
+        self.max_batch_pixels = max_batch_pixels
+        self.pow2_batches = pow2_batches
+        self.max_wait = max_wait_ms / 1000
+        self.bucket = bucket
+        self.pending = {}
+        self.timers = {}
+        self.running = set()
+        self.batch_sizes = Counter()
+
+    def bucket_key(self, height, width):
+        b = self.bucket
+        return (-(-height // b) * b, -(-width // b) * b)
+
+    def batch_limit(self, height, width):
+        # largest batch the batcher forms for inputs of this size
+        limit = self.max_batch_size
+        if self.max_batch_pixels is not None:
+            key_height, key_width = self.bucket_key(height, width)
+            limit = max(1, min(limit, self.max_batch_pixels // (key_height * key_width)))
+        if self.pow2_batches:
+            limit = 1 << (limit.bit_length() - 1)
+        return limit
+
+    async def submit(self, image_tensor):
+        _, _, height, width = image_tensor.shape
+        key = self.bucket_key(height, width)
+        future = asyncio.get_running_loop().create_future()
+        queue = self.pending.setdefault(key, [])
+        queue.append((image_tensor, future))
+        if len(queue) >= self.batch_limit(height, width):
+            self.flush(key)
+        elif len(queue) == 1:
+            self.timers[key] = asyncio.get_running_loop().call_later(self.max_wait, self.flush, key)
+        return await future
+
+    def flush(self, key):
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        items = self.pending.pop(key, [])
+        if items:
+            task = asyncio.get_running_loop().create_task(self._run(key, items))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def _run(self, key, items):
+        self.batch_sizes[len(items)] += 1
+        height = max(t.shape[2] for t, _ in items)
+        width = max(t.shape[3] for t, _ in items)
+        try:
+            if len(items) == 1:
+                batch = items[0][0]
+            else:
+                batch = torch.cat([self._pad(t, height, width) for t, _ in items])
+            output = await asyncio.get_running_loop().run_in_executor(self.executor, self.run_batch, batch)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, (tensor, future) in enumerate(items):
+            if future.done():
+                continue
+            _, _, h, w = tensor.shape
+            future.set_result(output[i, :, : h * self.scale, : w * self.scale])
+
+    def _pad(self, tensor, height, width):
+        _, _, h, w = tensor.shape
+        if (h, w) == (height, width):
+            return tensor
+        return F.pad(tensor, (0, width - w, 0, height - h), mode='replicate')
+
+    def stats(self):
+        batches = sum(self.batch_sizes.values())
+        images = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            'batches': batches,
+            'images': images,
+            'mean_batch_size': images / batches if batches else 0.0,
+            'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+        }
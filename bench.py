@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+from io import BytesIO
+
+import boto3
+from aiohttp import web
+from moto.server import ThreadedMotoServer
+from PIL import Image
+
+seeds = ['lr_face.png', 'lr_lion.png']
+bucket = 'esrgan-bench'
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        'p50_ms': pick(0.5) * 1000, 'p90_ms': pick(0.9) * 1000, 'p99_ms': pick(0.99) * 1000,
+        'mean_ms': sum(ordered) / len(ordered) * 1000, 'max_ms': ordered[-1] * 1000,
+    }
+
+
+def processes(esrgan):
+    # the service process and, with ESRGAN_WORKERS > 1, its workers
+    return [os.getpid()] + [w.process.pid for w in getattr(esrgan.engine, 'workers', [])]
+
+
+def reset_peak_rss(pids):
+    # Writing 5 to clear_refs sets VmHWM, the peak resident set, back to the
+    # current one (Linux >= 4.0), so each workload reports its own peak
+    # rather than the largest one run before it.
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+
+def peak_rss_mb(pids):
+    # summed over the processes; without /proc only the peak of the whole
+    # run so far is available, from ru_maxrss (KiB on Linux)
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+        except (OSError, StopIteration):
+            who = (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)
+            return sum(resource.getrusage(w).ru_maxrss for w in who) / 1024
+    return total / 1024
+
+
+def revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_inputs(sizes, variants):
+    # Every size gets `variants` PNGs that differ in one pixel, one per request
+    # of a workload, so no two requests ever share a cache entry or a
+    # single-flight call.
+    sources = [Image.open(p).convert('RGB') for p in seeds]
+    inputs = {}
+    for size in sizes:
+        for n in range(variants):
+            image = sources[n % len(sources)].resize((size, size), Image.BICUBIC)
+            image.putpixel((0, 0), (n % 256, n // 256 % 256, 0))
+            buffer = BytesIO()
+            image.save(buffer, format='PNG', compress_level=1)
+            inputs[(size, n)] = buffer.getvalue()
+    return inputs
+
+
+async def serve_inputs(inputs):
+    async def handle(request):
+        data = inputs[(int(request.match_info['size']), int(request.match_info['n']))]
+        return web.Response(body=data, content_type='image/png')
+
+    server = web.Application()
+    server.router.add_get('/{size}/{n}.png', handle)
+    runner = web.AppRunner(server, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def bench_stages(esrgan, base_url, variants, size, repeats):
+    # Same steps as ESRGAN.process/render, one at a time and timed separately.
+    from convert import image_to_tensor, tensor_to_image
+    from app import to_rgb
+    loop = asyncio.get_running_loop()
+    session = esrgan.fetcher._session()
+    output = esrgan.resolve_output()
+    timings = {stage: [] for stage in ('fetch', 'decode', 'to_tensor', 'inference', 'to_image', 'encode', 'upload')}
+
+    def timed(stage, start):
+        timings[stage].append(time.perf_counter() - start)
+
+    for n in range(repeats):
+        start = time.perf_counter()
+        async with session.get(f"{base_url}/{size}/{n % variants}.png") as response:
+            data = await response.read()
+        timed('fetch', start)
+        start = time.perf_counter()
+        image = Image.open(BytesIO(data))
+        image.load()
+        image = to_rgb(image)
+        timed('decode', start)
+        start = time.perf_counter()
+        image_tensor = image_to_tensor(image, esrgan.device.type == 'cuda')
+        timed('to_tensor', start)
+        start = time.perf_counter()
+        sr_tensor = await esrgan.upscale(image_tensor)
+        timed('inference', start)
+        start = time.perf_counter()
+        sr_image = tensor_to_image(sr_tensor)
+        timed('to_image', start)
+        start = time.perf_counter()
+        buffer = BytesIO()
+        sr_image.save(buffer, format=output.pil_format, **output.save_options())
+        timed('encode', start)
+        start = time.perf_counter()
+        await loop.run_in_executor(
+            esrgan.encode_pool,
+            lambda: esrgan.uploader.client.put_object(Bucket=bucket, Key=f"stages/{size}/{n}", Body=buffer.getvalue()),
+        )
+        timed('upload', start)
+    return {stage: percentiles(samples) for stage, samples in timings.items()}
+
+
+async def bench_end_to_end(esrgan, base_url, size, scale, concurrency, requests):
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = []
+
+    async def one(n):
+        async with slots:
+            start = time.perf_counter()
+            result = await esrgan.predict(f"{base_url}/{size}/{n}.png")
+            latencies.append(time.perf_counter() - start)
+            if 'error' in result:
+                errors.append(result['error'])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(requests)))
+    elapsed = time.perf_counter() - start
+    megapixels = requests * (size * scale) ** 2 / 1e6
+    return {
+        'latency': percentiles(latencies),
+        'requests_per_second': requests / elapsed,
+        'output_megapixels_per_second': megapixels / elapsed,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+    }
+
+
+async def run(esrgan, scale, args, sizes, levels):
+    variants = max(args.requests, max(levels))
+    inputs = make_inputs(sizes, variants)
+    runner, base_url = await serve_inputs(inputs)
+    results = {'stages': [], 'end_to_end': []}
+    try:
+        for size in sizes:
+            reset_peak_rss(processes(esrgan))
+            stages = await bench_stages(esrgan, base_url, variants, size, args.stage_repeats)
+            results['stages'].append({'size': size, 'stages': stages, 'peak_rss_mb': peak_rss_mb(processes(esrgan))})
+            print(f"stages {size:5}px " + ' '.join(f"{k}={v['p50_ms']:.1f}ms" for k, v in stages.items()), flush=True)
+        for size in sizes:
+            for concurrency in levels:
+                requests = max(args.requests, concurrency)
+                reset_peak_rss(processes(esrgan))
+                row = await bench_end_to_end(esrgan, base_url, size, scale, concurrency, requests)
+                row.update(size=size, concurrency=concurrency, requests=requests, peak_rss_mb=peak_rss_mb(processes(esrgan)))
+                results['end_to_end'].append(row)
+                print(f"predict {size:5}px x{concurrency:<3} p50 {row['latency']['p50_ms']:8.1f} ms "
+                      f"p99 {row['latency']['p99_ms']:8.1f} ms {row['requests_per_second']:7.2f} req/s "
+                      f"{row['output_megapixels_per_second']:7.2f} MP/s rss {row['peak_rss_mb']:.0f} MiB "
+                      f"errors {row['errors']}", flush=True)
+    finally:
+        await runner.cleanup()
+        await esrgan.fetcher.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark ESRGAN.predict end to end and per stage against local HTTP and S3 stand-ins. "
+                    "The model is configured with the same ESRGAN_* variables as the service."
+    )
+    parser.add_argument('--sizes', default='64,128,256,512,1024,2048')
+    parser.add_argument('--concurrency', default='1,4,16')
+    parser.add_argument('--requests', type=int, default=32, help="predict calls per size and concurrency level")
+    parser.add_argument('--stage-repeats', type=int, default=5)
+    parser.add_argument('--json', help="write the results here instead of stdout")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(',')]
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    s3 = ThreadedMotoServer(ip_address='127.0.0.1', port=0)
+    s3.start()
+    host, port = s3.get_host_and_port()
+    endpoint = f"http://{host}:{port}"
+    for name, value in {'AWS_ACCESS_KEY_ID': 'bench', 'AWS_SECRET_ACCESS_KEY': 'bench',
+                        'AWS_DEFAULT_REGION': 'us-east-1'}.items():
+        os.environ.setdefault(name, value)
+    boto3.client('s3', endpoint_url=endpoint).create_bucket(Bucket=bucket)
+    # app reads its configuration at import time: point uploads at the
+    # stand-in and turn the result cache off so every request is computed
+    os.environ.update(ESRGAN_S3_BUCKET=bucket, ESRGAN_S3_ENDPOINT=endpoint,
+                      ESRGAN_CACHE_DIR='', ESRGAN_CACHE_MEMORY_ITEMS='0')
+    import app
+
+    setup_start = time.perf_counter()
+    esrgan = app.ESRGAN()
+    esrgan.setup()
+    esrgan.loader.result()
+    setup_seconds = time.perf_counter() - setup_start
+    setup_rss_mb = peak_rss_mb(processes(esrgan))
+    try:
+        results = asyncio.run(run(esrgan, app.scale, args, sizes, levels))
+    finally:
+        s3.stop()
+
+    report = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'engine': esrgan.engine.describe(),
+        'backend': app.backend,
+        'scale': app.scale,
+        'setup_seconds': setup_seconds,
+        'setup_peak_rss_mb': setup_rss_mb,
+        'peak_rss_mb': max([setup_rss_mb] + [row['peak_rss_mb'] for rows in results.values() for row in rows]),
+        **results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
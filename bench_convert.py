@@ -0,0 +1,83 @@
+import argparse
+import json
+import time
+import tracemalloc
+
+import torch
+from PIL import Image
+from torch.profiler import ProfilerActivity, profile
+from torchvision import transforms
+
+from convert import image_to_tensor, tensor_to_image
+
+
+def legacy_to_tensor(image):
+    return transforms.ToTensor()(image).unsqueeze(0)
+
+
+def legacy_to_image(tensor):
+    return transforms.ToPILImage()(tensor)
+
+
+def allocations(fn, *args):
+    tracemalloc.start()
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn(*args)
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    events = [e for e in prof.events() if e.name == '[memory]' and e.cpu_memory_usage > 0]
+    return {
+        'torch_allocations': len(events),
+        'torch_bytes': sum(e.cpu_memory_usage for e in events),
+        'python_peak_bytes': python_peak,
+    }
+
+
+def timed(fn, make_args, repeats):
+    best = None
+    for _ in range(repeats):
+        args = make_args()
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the PIL <-> tensor conversion paths")
+    parser.add_argument('--image', default='lr_lion.png')
+    parser.add_argument('--sizes', default='256,512,1024')
+    parser.add_argument('--scale', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    source = Image.open(args.image).convert('RGB')
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        image = source.resize((size, size), Image.BICUBIC)
+        output = torch.rand(3, size * args.scale, size * args.scale)
+        stages = {
+            'to_tensor': (legacy_to_tensor, image_to_tensor, lambda: (image,), size * size),
+            'to_image': (legacy_to_image, tensor_to_image, lambda: (output.clone(),), output[0].numel()),
+        }
+        for stage, (old, new, make_args, pixels) in stages.items():
+            for path, fn in (('legacy', old), ('lean', new)):
+                seconds = timed(fn, make_args, args.repeats)
+                row = {
+                    'stage': stage, 'path': path, 'size': size,
+                    'ms_per_megapixel': seconds * 1000 / (pixels / 1e6),
+                    **allocations(fn, *make_args()),
+                }
+                results.append(row)
+                print(f"{stage:9} {path:6} {size:5}px {row['ms_per_megapixel']:8.2f} ms/MP "
+                      f"{row['torch_allocations']:3} torch allocs {row['torch_bytes'] / 2**20:8.1f} MiB "
+                      f"python peak {row['python_peak_bytes'] / 2**20:8.1f} MiB")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
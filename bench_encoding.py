@@ -0,0 +1,89 @@
+import argparse
+import io
+import json
+import os
+import time
+
+from PIL import Image
+
+from encoding import OutputFormat, available_formats
+
+candidates = [
+    ('png', {'compression': 1}),
+    ('png', {'compression': 3}),
+    ('png', {'compression': 6}),
+    ('png', {'compression': 9}),
+    ('jpeg', {'quality': 85}),
+    ('jpeg', {'quality': 95}),
+    ('webp', {'lossless': True, 'compression': 0}),
+    ('webp', {'lossless': True, 'compression': 4}),
+    ('webp', {'quality': 80}),
+    ('webp', {'quality': 90}),
+    ('avif', {'quality': 60}),
+    ('avif', {'quality': 80}),
+]
+
+
+def upscaled_samples(paths, weights, scale):
+    # Real x4 outputs when the weights are present, bicubic stand-ins otherwise
+    # (same dimensions, but smoother content that compresses better).
+    images = {os.path.basename(p): Image.open(p).convert('RGB') for p in paths}
+    if os.path.isfile(weights):
+        import torch
+        from torchvision import transforms
+        from engine import Engine, load_model
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        engine = Engine(load_model(device, weights, scale))
+        to_tensor, to_pil = transforms.ToTensor(), transforms.ToPILImage()
+        return {name: to_pil(engine(to_tensor(im).unsqueeze(0))[0]) for name, im in images.items()}, 'esrgan'
+    return {name: im.resize((im.width * scale, im.height * scale), Image.BICUBIC) for name, im in images.items()}, 'bicubic'
+
+
+def measure(image, output, repeats):
+    options = output.save_options()
+    best = None
+    for _ in range(repeats):
+        buffer = io.BytesIO()
+        start = time.perf_counter()
+        image.save(buffer, format=output.pil_format, **options)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, buffer.tell()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare output encodings by encode time and size")
+    parser.add_argument('images', nargs='*', default=['lr_face.png', 'lr_lion.png'])
+    parser.add_argument('--weights', default='models/RealESRGAN_x4plus.pth')
+    parser.add_argument('--scale', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    samples, source = upscaled_samples(args.images, args.weights, args.scale)
+    formats = available_formats()
+    results = []
+    for name, image in samples.items():
+        megapixels = image.width * image.height / 1e6
+        baseline = None
+        for format, options in candidates:
+            if format not in formats:
+                continue
+            output = OutputFormat(format, **options)
+            seconds, size = measure(image, output, args.repeats)
+            if baseline is None:
+                baseline = size
+            results.append({
+                'image': name, 'source': source, 'encoding': output.tag(),
+                'ms': seconds * 1000, 'ms_per_megapixel': seconds * 1000 / megapixels,
+                'bytes': size, 'size_vs_png1': size / baseline,
+            })
+            print(f"{name:12} {output.tag():48} {seconds * 1000:8.1f} ms {size / 1024:9.0f} KiB "
+                  f"{size / baseline:6.2f}x")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from io import BytesIO
+
+import boto3
+from PIL import Image
+
+import app
+from convert import image_to_tensor, tensor_to_image
+from encoding import OutputFormat
+from upload import Uploader
+
+image_extensions = {'.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff'}
+
+
+def split_s3(location):
+    bucket, _, prefix = location[len('s3://'):].partition('/')
+    return bucket, f"{prefix.strip('/')}/" if prefix.strip('/') else ''
+
+
+class Source:
+    """Image files under a local directory or an s3://bucket/prefix, by relative name."""
+
+    def __init__(self, location, client):
+        self.location = location
+        self.client = client
+        self.s3 = location.startswith('s3://')
+
+    def list(self):
+        if self.s3:
+            bucket, prefix = split_s3(self.location)
+            for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+                for entry in page.get('Contents', []):
+                    name = entry['Key'][len(prefix):]
+                    if os.path.splitext(name)[1].lower() in image_extensions:
+                        yield name
+            return
+        for root, dirs, files in os.walk(self.location):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in image_extensions:
+                    yield os.path.relpath(os.path.join(root, name), self.location)
+
+    def read(self, name):
+        if self.s3:
+            bucket, prefix = split_s3(self.location)
+            data = self.client.get_object(Bucket=bucket, Key=prefix + name)['Body'].read()
+        else:
+            with open(os.path.join(self.location, name), 'rb') as f:
+                data = f.read()
+        image = Image.open(BytesIO(data))
+        image.load()
+        return app.to_rgb(image)
+
+
+class Destination:
+    """Where outputs go; the output name is the input name with the encoding's extension."""
+
+    def __init__(self, location, client, output):
+        self.location = location
+        self.output = output
+        self.s3 = location.startswith('s3://')
+        self.existing = set()
+        if self.s3:
+            bucket, prefix = split_s3(location)
+            self.uploader = Uploader(bucket, prefix, app.s3_endpoint, app.s3_region, app.s3_public_url,
+                                     app.s3_part_mb * 1024 * 1024, app.s3_concurrency)
+            # one listing up front instead of a HEAD per item
+            for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+                self.existing.update(entry['Key'][len(prefix):] for entry in page.get('Contents', []))
+
+    def name(self, source_name):
+        return f"{os.path.splitext(source_name)[0]}.{self.output.extension}"
+
+    def exists(self, source_name):
+        name = self.name(source_name)
+        if self.s3:
+            return name in self.existing
+        return os.path.isfile(os.path.join(self.location, name))
+
+    def write(self, source_name, image):
+        if self.s3:
+            return self.uploader.upload_image(image, self.output, os.path.splitext(source_name)[0])
+        path = os.path.join(self.location, self.name(source_name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written under a temporary name so an interrupted run never leaves
+        # a truncated file that the next run would skip
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            image.save(f, format=self.output.pil_format, **self.output.save_options())
+        os.replace(tmp, path)
+        return path
+
+
+class Manifest:
+    """Append-only JSON lines log of finished items, read back to resume.
+
+    Every entry records the run it belongs to (source, destination and output
+    encoding), and only entries of the same run count as done, so one
+    manifest file can be shared by different jobs.
+    """
+
+    def __init__(self, path, source, destination, output_tag):
+        self.path = path
+        self.run = {'source': source, 'destination': destination, 'output': output_tag}
+        self.done = set()
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # last line of an interrupted run
+                    if entry.get('status') == 'done' and all(entry.get(k) == v for k, v in self.run.items()):
+                        self.done.add(entry['name'])
+        self.file = open(path, 'a')
+
+    def record(self, **entry):
+        self.file.write(json.dumps({**self.run, **entry}) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class Progress:
+    def __init__(self, every):
+        self.every = every
+        self.start = time.perf_counter()
+        self.images = 0
+        self.megapixels = 0.0
+        self.skipped = 0
+        self.failed = 0
+
+    def add(self, megapixels):
+        self.images += 1
+        self.megapixels += megapixels
+        if self.images % self.every == 0:
+            self.report()
+
+    def report(self, final=False):
+        elapsed = time.perf_counter() - self.start
+        print(f"{'done' if final else 'progress'}: {self.images} upscaled, {self.skipped} skipped, "
+              f"{self.failed} failed in {elapsed:.1f}s, {self.images / elapsed:.2f} images/s, "
+              f"{self.megapixels / elapsed:.2f} output MP/s", flush=True)
+
+
+async def upscale_one(esrgan, source, destination, name):
+    # read/decode and encode/write run on the service's codec and encode
+    # pools and inference goes through its batcher, so with enough items in
+    # flight every stage stays busy
+    loop = asyncio.get_running_loop()
+    image = await loop.run_in_executor(esrgan.codec_pool, source.read, name)
+    image_tensor = await loop.run_in_executor(
+        esrgan.codec_pool, image_to_tensor, image, esrgan.device.type == 'cuda'
+    )
+    sr_image = await loop.run_in_executor(esrgan.codec_pool, tensor_to_image, await esrgan.upscale(image_tensor))
+    output = await loop.run_in_executor(esrgan.encode_pool, destination.write, name, sr_image)
+    return output, sr_image.width * sr_image.height / 1e6
+
+
+async def run(esrgan, source, destination, manifest, concurrency, progress):
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+
+    async def item(name):
+        try:
+            output, megapixels = await upscale_one(esrgan, source, destination, name)
+        except Exception as e:
+            progress.failed += 1
+            print(f"Error: {name}: {e}")
+            manifest.record(name=name, status='failed', error=str(e))
+        else:
+            progress.add(megapixels)
+            manifest.record(name=name, status='done', location=output)
+        finally:
+            slots.release()
+
+    for name in source.list():
+        if name in manifest.done or destination.exists(name):
+            progress.skipped += 1
+            continue
+        await slots.acquire()
+        task = asyncio.ensure_future(item(name))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.wait(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Upscale every image under a directory or s3://bucket/prefix. Model, backend, "
+                    "precision and worker processes are configured with the same ESRGAN_* variables as the service."
+    )
+    parser.add_argument('source', help="local directory or s3://bucket/prefix")
+    parser.add_argument('destination', help="local directory or s3://bucket/prefix")
+    parser.add_argument('--format', default=app.output_format)
+    parser.add_argument('--quality', type=int)
+    parser.add_argument('--lossless', action='store_true')
+    parser.add_argument('--compression', type=int)
+    parser.add_argument('--manifest', default='bulk_manifest.jsonl',
+                        help="finished items are logged here and skipped when the run is restarted")
+    parser.add_argument('--concurrency', type=int, default=4 * app.batch_max_size,
+                        help="images in flight across all pipeline stages")
+    parser.add_argument('--report-every', type=int, default=100)
+    args = parser.parse_args()
+
+    output = OutputFormat(args.format, args.quality, args.lossless, args.compression, app.encoder_threads)
+    client = boto3.client('s3', endpoint_url=app.s3_endpoint, region_name=app.s3_region)
+    source = Source(args.source, client)
+    destination = Destination(args.destination, client, output)
+    location = lambda l: l if l.startswith('s3://') else os.path.abspath(l)
+    manifest = Manifest(args.manifest, location(args.source), location(args.destination), output.tag())
+
+    esrgan = app.ESRGAN()
+    esrgan.setup()
+    esrgan.loader.result()
+    progress = Progress(args.report_every)
+    try:
+        asyncio.run(run(esrgan, source, destination, manifest, args.concurrency, progress))
+    finally:
+        manifest.close()
+        progress.report(final=True)
+
+
+if __name__ == '__main__':
+    main()
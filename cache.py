@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+class ResultCache:
+    """Maps upscale inputs to already-uploaded results.
+
+    Keys are the sha256 of the decoded pixels plus a model tag (model, scale,
+    weights version), so the same image fetched from different URLs still
+    hits. Entries live in an in-memory LRU backed by a directory of small JSON
+    files whose total size is capped; least recently used files go first.
+    """
+
+    def __init__(self, model_tag, memory_items=10000, directory=None, disk_bytes=256 * 1024 * 1024):
+        self.model_tag = model_tag
+        self.memory_items = memory_items
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        self.disk_used = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.disk_used = sum(size for _, _, size in self._disk_entries())
+
+    def key(self, image, variant=''):
+        h = hashlib.sha256()
+        h.update(f"{self.model_tag}|{variant}|{image.mode}|{image.width}x{image.height}|".encode())
+        h.update(image.tobytes())
+        return h.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits['memory'] += 1
+                return self.memory[key]
+        value = self._disk_get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits['disk'] += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        with self.lock:
+            self._remember(key, value)
+        if self.directory:
+            self._disk_put(key, value)
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _disk_get(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def _disk_put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value).encode()
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self.lock:
+            self.disk_used += len(data)
+            over = self.disk_used > self.disk_bytes
+        if over:
+            self._evict()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_mtime, st.st_size
+
+    def _evict(self):
+        # trim to 90% so that eviction is not re-run on every insert
+        entries = sorted(self._disk_entries(), key=lambda e: e[1])
+        used = sum(size for _, _, size in entries)
+        target = self.disk_bytes * 0.9
+        for path, _, size in entries:
+            if used <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            used -= size
+        with self.lock:
+            self.disk_used = used
+
+    def stats(self):
+        with self.lock:
+            hits = self.hits['memory'] + self.hits['disk']
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.hits['memory'],
+                'disk_hits': self.hits['disk'],
+                'misses': self.misses,
+                'hit_ratio': hits / lookups if lookups else 0.0,
+                'memory_items': len(self.memory),
+                'disk_bytes': self.disk_used,
+            }
@@ -0,0 +1,51 @@
+import threading
+import warnings
+
+import torch
+from PIL import Image
+
+_local = threading.local()
+
+
+def image_to_tensor(image, pin_memory=False):
+    """Decoded RGB PIL image -> (1, 3, H, W) float tensor in [0, 1].
+
+    The pixels are copied once out of PIL as raw bytes and then converted
+    straight into the float batch, normalized in place.
+    """
+    with warnings.catch_warnings():
+        # only ever read from
+        warnings.filterwarnings('ignore', message='The given buffer is not writable')
+        pixels = torch.frombuffer(image.tobytes(), dtype=torch.uint8).view(image.height, image.width, 3)
+    batch = torch.empty((1, 3, image.height, image.width), pin_memory=pin_memory)
+    batch[0].copy_(pixels.permute(2, 0, 1))
+    return batch.div_(255)
+
+
+def _output_buffer(shape, max_reuse_bytes):
+    # one grow-only uint8 buffer per thread, so repeated encodes of
+    # similar-sized outputs do not allocate
+    size = shape[0] * shape[1] * shape[2]
+    if size > max_reuse_bytes:
+        return torch.empty(shape, dtype=torch.uint8)
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None or buffer.numel() < size:
+        buffer = _local.buffer = torch.empty(size, dtype=torch.uint8)
+    return buffer[:size].view(shape)
+
+
+def tensor_to_image(tensor, max_reuse_bytes=64 * 1024 * 1024):
+    """(3, H, W) float tensor in [0, 1] or uint8 tensor -> RGB PIL image.
+
+    Tiled upscales already come back as an image and pass through. Float input is quantized in place (the tensor is consumed) and written
+    straight into an HWC uint8 buffer that Pillow copies from, so the buffer
+    can be reused as soon as this returns.
+    """
+    if isinstance(tensor, Image.Image):
+        return tensor
+    c, h, w = tensor.shape
+    buffer = _output_buffer((h, w, c), max_reuse_bytes)
+    if tensor.dtype != torch.uint8:
+        tensor = tensor.mul_(255).round_()
+    buffer.copy_(tensor.permute(1, 2, 0))
+    return Image.frombytes('RGB', (w, h), buffer.numpy())
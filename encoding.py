@@ -0,0 +1,70 @@
+from PIL import Image
+
+try:
+    import pillow_avif  # noqa: F401  registers AVIF on Pillow < 11.3
+except ImportError:
+    pass
+
+formats = {'png': 'PNG', 'jpeg': 'JPEG', 'jpg': 'JPEG', 'webp': 'WEBP', 'avif': 'AVIF'}
+extensions = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp', 'AVIF': 'avif'}
+
+
+def available_formats():
+    Image.init()
+    return [name for name, pil in formats.items() if pil in Image.SAVE]
+
+
+class OutputFormat:
+    """Encoding requested for an upscaled image.
+
+    `quality` applies to JPEG, lossy WebP and AVIF; `compression` is the PNG
+    zlib level (0-9) or the WebP/AVIF speed/effort setting; `lossless` only
+    applies to WebP.
+    """
+
+    def __init__(self, format='png', quality=None, lossless=False, compression=None, threads=0):
+        name = format.lower()
+        if name not in formats:
+            raise ValueError(f"Unsupported output format {format!r}, expected one of {sorted(formats)}")
+        if name not in available_formats():
+            raise ValueError(f"Output format {format!r} is not available in this Pillow build")
+        if quality is not None and not 0 <= quality <= 100:
+            raise ValueError(f"quality must be between 0 and 100, got {quality}")
+        if lossless and formats[name] != 'WEBP':
+            raise ValueError("lossless is only supported for webp")
+        self.pil_format = formats[name]
+        self.quality = quality
+        self.lossless = lossless
+        self.compression = compression
+        self.threads = threads
+
+    @property
+    def extension(self):
+        return extensions[self.pil_format]
+
+    @property
+    def content_type(self):
+        return f"image/{self.pil_format.lower()}"
+
+    def save_options(self):
+        f = self.pil_format
+        options = {}
+        if f == 'PNG':
+            options['compress_level'] = 6 if self.compression is None else self.compression
+        elif f == 'JPEG':
+            options['quality'] = 90 if self.quality is None else self.quality
+            options['optimize'] = False
+        elif f == 'WEBP':
+            options['lossless'] = self.lossless
+            options['quality'] = (80 if not self.lossless else 100) if self.quality is None else self.quality
+            options['method'] = 4 if self.compression is None else self.compression
+        elif f == 'AVIF':
+            options['quality'] = 75 if self.quality is None else self.quality
+            options['speed'] = 8 if self.compression is None else self.compression
+            if self.threads:
+                options['max_threads'] = self.threads
+        return options
+
+    def tag(self):
+        options = ','.join(f"{k}={v}" for k, v in sorted(self.save_options().items()) if k != 'max_threads')
+        return f"{self.extension}:{options}"
@@ -0,0 +1,244 @@
+import argparse
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from RealESRGAN import RealESRGAN
+
+from convert import image_to_tensor
+from weights import load_mapped, mapped_path
+
+precisions = {'fp32': None, 'fp16': torch.float16, 'bf16': torch.bfloat16}
+compile_modes = ['eager', 'compile', 'trace']
+reference_images = ['lr_face.png', 'lr_lion.png']
+
+
+def load_model(device, weight_file, scale):
+    model = RealESRGAN(device, scale=scale)
+    mapped = mapped_path(weight_file)
+    if os.path.isfile(mapped):
+        # on the CPU the parameters stay views of the shared page-cache mapping
+        model.model.load_state_dict(load_mapped(mapped), strict=True, assign=device.type == 'cpu')
+        model.model.eval().to(device)
+        return model
+    if not os.path.isfile(weight_file):
+        raise FileNotFoundError(f"Model weights not found at {weight_file}")
+    model.load_weights(weight_file)
+    return model
+
+
+def build_engine(weight_file, scale, *options):
+    # picklable factory for worker processes, which run on the CPU
+    return Engine(load_model(torch.device('cpu'), weight_file, scale), *options)
+
+
+def cpu_supports_bf16():
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def supported_precision(device, precision):
+    if precision == 'fp32':
+        return True
+    if device.type == 'cuda':
+        return precision == 'fp16' or torch.cuda.is_bf16_supported()
+    return precision == 'bf16' and cpu_supports_bf16()
+
+
+class Engine:
+    """Runs the RRDB network behind a RealESRGAN model on (N, 3, H, W) float batches in [0, 1].
+
+    In the compiled modes inputs are padded to a bucketed shape (spatial size
+    a multiple of `bucket`, batch a power of two) and one graph is kept per
+    shape. Shapes beyond `max_graphs` run eagerly instead of recompiling.
+    """
+
+    def __init__(self, realesrgan, precision='fp32', channels_last=False,
+                 compile_mode='eager', bucket=64, max_graphs=16):
+        self.device = realesrgan.device
+        self.scale = realesrgan.scale
+        self.model = realesrgan.model.eval()
+        if not supported_precision(self.device, precision):
+            print(f"Precision {precision} is not supported on {self.device}, using fp32")
+            precision = 'fp32'
+        self.precision = precision
+        self.channels_last = channels_last
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        if compile_mode not in compile_modes:
+            raise ValueError(f"Unknown compile mode {compile_mode!r}, expected one of {compile_modes}")
+        self.compile_mode = compile_mode
+        self.bucket = bucket
+        self.max_graphs = max_graphs
+        self.graphs = OrderedDict()
+        self.graphs_lock = threading.Lock()
+        self.compiled = None
+        if compile_mode == 'compile':
+            torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, max_graphs)
+            self.compiled = torch.compile(self.model, dynamic=False)
+
+    def autocast(self):
+        if self.precision == 'fp32':
+            return contextlib.nullcontext()
+        return torch.autocast(self.device.type, dtype=precisions[self.precision])
+
+    def bucket_shape(self, shape):
+        n, c, h, w = shape
+        b = self.bucket
+        return (1 << (n - 1).bit_length(), c, -(-h // b) * b, -(-w // b) * b)
+
+    def _pad(self, batch, shape):
+        n, _, h, w = batch.shape
+        batch = F.pad(batch, (0, shape[3] - w, 0, shape[2] - h), mode='replicate')
+        if shape[0] > n:
+            batch = torch.cat([batch, batch[-1:].expand(shape[0] - n, -1, -1, -1)])
+        return batch
+
+    def _graph(self, batch):
+        if self.compile_mode == 'eager':
+            return self.model
+        shape = tuple(batch.shape)
+        # lane threads call in concurrently; a shape is traced only once
+        with self.graphs_lock:
+            if shape in self.graphs:
+                self.graphs.move_to_end(shape)
+                return self.graphs[shape]
+            if len(self.graphs) >= self.max_graphs:
+                return self.model
+            if self.compile_mode == 'trace':
+                graph = torch.jit.freeze(torch.jit.trace(self.model, batch))
+            else:
+                graph = self.compiled
+            self.graphs[shape] = graph
+            return graph
+
+    def __call__(self, batch):
+        n, _, h, w = batch.shape
+        if self.compile_mode != 'eager':
+            shape = self.bucket_shape(batch.shape)
+            if shape != tuple(batch.shape):
+                batch = self._pad(batch, shape)
+        batch = batch.to(self.device, non_blocking=True)
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad(), self.autocast():
+            output = self._graph(batch)(batch)
+        output = output[:n, :, : h * self.scale, : w * self.scale]
+        return output.float().clamp_(0, 1).cpu()
+
+    def warmup(self, shapes):
+        # shapes are (batch size, side) pairs
+        start = time.perf_counter()
+        for n, size in shapes:
+            self(torch.rand(n, 3, size, size))
+        return time.perf_counter() - start
+
+    def describe(self):
+        return {
+            'device': str(self.device),
+            'precision': self.precision,
+            'channels_last': self.channels_last,
+            'compile_mode': self.compile_mode,
+            'graphs': len(self.graphs),
+        }
+
+
+class QuantizedEngine(Engine):
+    """Engine over an INT8 TorchScript module written by quantize.py."""
+
+    def __init__(self, path, scale):
+        torch.backends.quantized.engine = 'x86'
+        module = torch.jit.load(path, map_location='cpu')
+        super().__init__(SimpleNamespace(device=torch.device('cpu'), scale=scale, model=module))
+        self.precision = 'int8'
+
+    def autocast(self):
+        return contextlib.nullcontext()
+
+
+def quantized_path(weight_file):
+    root, _ = os.path.splitext(weight_file)
+    return f"{root}_int8.pt"
+
+
+def psnr(a, b):
+    mse = torch.mean((a.float() - b.float()) ** 2).item()
+    return float('inf') if mse == 0 else 10 * math.log10(1 / mse)
+
+
+def ssim(a, b, window=11, sigma=1.5):
+    a, b = a.float(), b.float()
+    channels = a.shape[1]
+    coords = torch.arange(window, dtype=torch.float32) - window // 2
+    g = torch.exp(-coords ** 2 / (2 * sigma ** 2))
+    g /= g.sum()
+    kernel = (g[:, None] * g[None, :]).expand(channels, 1, window, window)
+
+    def blur(x):
+        return F.conv2d(x, kernel, groups=channels)
+
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a ** 2
+    var_b = blur(b * b) - mu_b ** 2
+    cov = blur(a * b) - mu_a * mu_b
+    c1, c2 = 0.01 ** 2, 0.03 ** 2
+    s = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return s.mean().item()
+
+
+def load_reference(paths=reference_images):
+    return {os.path.basename(p): image_to_tensor(Image.open(p).convert('RGB')) for p in paths}
+
+
+def accuracy_report(engine, reference, images, repeats=3):
+    report = {}
+    for name, tensor in images.items():
+        expected = reference(tensor)
+        engine(tensor)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            output = engine(tensor)
+        report[name] = {
+            'psnr': psnr(output, expected),
+            'ssim': ssim(output, expected),
+            'seconds': (time.perf_counter() - start) / repeats,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference modes against fp32 on the reference images")
+    parser.add_argument('--weights', default='models/RealESRGAN_x4plus.pth')
+    parser.add_argument('--scale', type=int, default=4)
+    parser.add_argument('--min-psnr', type=float, default=40.0)
+    parser.add_argument('images', nargs='*', default=reference_images)
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    realesrgan = load_model(device, args.weights, args.scale)
+    images = load_reference(args.images)
+    reference = Engine(realesrgan)
+    for precision in precisions:
+        for channels_last in (False, True):
+            engine = Engine(realesrgan, precision, channels_last)
+            if engine.precision != precision:
+                continue
+            for name, result in accuracy_report(engine, reference, images).items():
+                verdict = 'ok' if result['psnr'] >= args.min_psnr else 'below tolerance'
+                print(f"{precision:5} channels_last={channels_last!s:5} {name:12} "
+                      f"{result['psnr']:6.2f} dB {result['seconds'] * 1000:8.1f} ms  {verdict}")
+
+
+if __name__ == '__main__':
+    main()
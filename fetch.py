@@ -0,0 +1,157 @@
+import asyncio
+from collections import Counter
+from io import BytesIO
+
+import aiohttp
+from PIL import Image, ImageFile
+
+# formats that are checked as another one: MPO, what PIL calls camera JPEGs
+# with an embedded preview, decodes as its first (JPEG) frame
+aliases = {'MPO': 'JPEG'}
+
+
+class FetchError(Exception):
+    def __init__(self, code, message, status=None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+    def to_dict(self):
+        return {'code': self.code, 'status': self.status, 'message': str(self)}
+
+
+def _load(body):
+    body.seek(0)
+    image = Image.open(body)
+    image.load()
+    return image
+
+
+class ImageFetcher:
+    """Downloads images over a shared keep-alive connection pool.
+
+    The body is streamed in chunks straight into PIL's incremental parser, so
+    the payload is never held as a separate bytes object next to the image.
+    Until the parser has read the header, each chunk is parsed before the
+    next one is downloaded; the format and dimensions are then checked
+    against `formats` and `max_pixels`, so oversized inputs and decompression
+    bombs are dropped after the first few kilobytes. From there, formats
+    with an incremental decoder in PIL (BMP, GIF, TIFF) keep being decoded
+    on the codec pool while the rest downloads; the others, including PNG,
+    JPEG and WebP, are collected into one buffer and decoded once at the end.
+    """
+
+    def __init__(self, connect_timeout=5, read_timeout=30, max_bytes=64 * 1024 * 1024,
+                 pool_size=100, per_host=16, chunk_size=64 * 1024, executor=None,
+                 max_pixels=None, formats=None, max_header_bytes=1024 * 1024):
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_bytes = max_bytes
+        self.pool_size = pool_size
+        self.per_host = per_host
+        self.chunk_size = chunk_size
+        self.executor = executor
+        self.max_pixels = max_pixels
+        self.formats = {f.upper() for f in formats} if formats else None
+        self.max_header_bytes = max_header_bytes
+        self.session = None
+        self.fetched = 0
+        self.bytes_received = 0
+        self.errors = Counter()
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.per_host, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.session
+
+    async def fetch(self, url, on_header=None):
+        # on_header(image) is called once, as soon as the format and size are
+        # known and before the pixel data has been decoded
+        try:
+            async with self._session().get(url) as response:
+                if response.status != 200:
+                    raise FetchError('http_status', f"{url} returned HTTP {response.status}", response.status)
+                if response.content_length is not None and response.content_length > self.max_bytes:
+                    raise FetchError('too_large', f"{url} is {response.content_length} bytes, limit is {self.max_bytes}")
+                return await self._decode(url, response.content, on_header)
+        except FetchError as e:
+            self.errors[e.code] += 1
+            raise
+        except asyncio.TimeoutError:
+            raise self._error('timeout', f"Timed out fetching {url}")
+        except aiohttp.InvalidURL:
+            raise self._error('invalid_url', f"Invalid URL: {url}")
+        except aiohttp.ClientError as e:
+            raise self._error('connection', f"Could not fetch {url}: {e}")
+
+    def _error(self, code, message):
+        self.errors[code] += 1
+        return FetchError(code, message)
+
+    def _probe(self, url, header):
+        format = aliases.get(header.format, header.format)
+        if self.formats is not None and format not in self.formats:
+            raise FetchError('format', f"{url} is {header.format}, allowed formats are {sorted(self.formats)}")
+        width, height = header.size
+        if self.max_pixels is not None and width * height > self.max_pixels:
+            raise FetchError('too_many_pixels', f"{url} is {width}x{height}, limit is {self.max_pixels} pixels")
+
+    async def _decode(self, url, stream, on_header=None):
+        loop = asyncio.get_running_loop()
+        parser = ImageFile.Parser()
+        received = 0
+        feeding = None
+        header = None
+        body = None
+        try:
+            async for chunk in stream.iter_chunked(self.chunk_size):
+                received += len(chunk)
+                if received > self.max_bytes:
+                    raise FetchError('too_large', f"{url} exceeded {self.max_bytes} bytes")
+                self.bytes_received += len(chunk)
+                if body is not None:
+                    body.write(chunk)
+                    continue
+                if feeding is not None:
+                    await feeding
+                feeding = loop.run_in_executor(self.executor, parser.feed, chunk)
+                if header is not None:
+                    # decode this chunk on the codec pool while the next one is read
+                    continue
+                await feeding
+                feeding = None
+                if parser.image is None:
+                    if received > self.max_header_bytes:
+                        raise FetchError('decode', f"No image header in the first {received} bytes of {url}")
+                    continue
+                header = parser.image
+                self._probe(url, header)
+                if on_header is not None:
+                    on_header(header)
+                if parser.decoder is None:
+                    # the parser would re-concatenate everything it has on
+                    # every further chunk
+                    body = BytesIO()
+                    body.write(parser.data)
+            if feeding is not None:
+                await feeding
+            if body is not None:
+                image = await loop.run_in_executor(self.executor, _load, body)
+            else:
+                image = await loop.run_in_executor(self.executor, parser.close)
+            self.fetched += 1
+            return image
+        except Image.DecompressionBombError as e:
+            raise FetchError('too_many_pixels', f"Rejected {url}: {e}")
+        except (OSError, SyntaxError) as e:
+            raise FetchError('decode', f"Could not decode image from {url}: {e}")
+        finally:
+            if feeding is not None and not feeding.done():
+                feeding.cancel()
+
+    def stats(self):
+        return {'images': self.fetched, 'bytes_received': self.bytes_received, 'errors': dict(self.errors)}
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
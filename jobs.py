@@ -0,0 +1,143 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+
+import aiohttp
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, url, webhook=None):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.webhook = webhook
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'url': self.url,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class JobQueue:
+    """Bounded queue of upscale jobs run in the background by `concurrency` consumers.
+
+    Finished jobs are kept for `retention` seconds so clients can poll them;
+    if a job has a webhook its final state is POSTed there as JSON.
+    """
+
+    def __init__(self, handler, max_depth=100, concurrency=1, retention=3600, webhook_timeout=10):
+        self.handler = handler
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self.retention = retention
+        self.webhook_timeout = aiohttp.ClientTimeout(total=webhook_timeout)
+        self.queue = None
+        self.queued = OrderedDict()
+        self.jobs = {}
+        self.consumers = []
+        self.notifying = set()
+        self.mean_seconds = None
+
+    def _start(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self.consumers = [asyncio.ensure_future(self._consume()) for _ in range(self.concurrency)]
+
+    def submit(self, url, webhook=None):
+        self._start()
+        self._expire()
+        if len(self.queued) >= self.max_depth:
+            raise QueueFull(f"Job queue is full ({self.max_depth} jobs waiting)")
+        job = Job(url, webhook)
+        self.jobs[job.id] = job
+        self.queued[job.id] = job
+        self.queue.put_nowait(job)
+        return self.status(job.id)
+
+    def position(self, job_id):
+        for i, queued_id in enumerate(self.queued):
+            if queued_id == job_id:
+                return i
+        return None
+
+    def eta(self, position):
+        if self.mean_seconds is None:
+            return None
+        running = sum(1 for job in self.jobs.values() if job.status == 'running')
+        return self.mean_seconds * ((position + running) / self.concurrency + 1)
+
+    def status(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        status = job.to_dict()
+        if job.status == 'queued':
+            status['position'] = self.position(job_id)
+            status['eta_seconds'] = self.eta(status['position'])
+        elif job.status == 'running' and self.mean_seconds is not None:
+            status['eta_seconds'] = max(0.0, self.mean_seconds - (time.time() - job.started))
+        status['queue_depth'] = len(self.queued)
+        return status
+
+    def stats(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            'queue_depth': len(self.queued),
+            'max_depth': self.max_depth,
+            'concurrency': self.concurrency,
+            'mean_job_seconds': self.mean_seconds,
+            'jobs': counts,
+        }
+
+    async def _consume(self):
+        while True:
+            job = await self.queue.get()
+            self.queued.pop(job.id, None)
+            job.status = 'running'
+            job.started = time.time()
+            try:
+                job.result = await self.handler(job.url)
+                job.status = 'done'
+            except Exception as e:
+                job.error = str(e)
+                job.status = 'failed'
+            job.finished = time.time()
+            elapsed = job.finished - job.started
+            self.mean_seconds = elapsed if self.mean_seconds is None else 0.8 * self.mean_seconds + 0.2 * elapsed
+            if job.webhook:
+                task = asyncio.ensure_future(self._notify(job))
+                self.notifying.add(task)
+                task.add_done_callback(self.notifying.discard)
+
+    async def _notify(self, job):
+        try:
+            async with aiohttp.ClientSession(timeout=self.webhook_timeout) as session:
+                async with session.post(job.webhook, json=job.to_dict()) as response:
+                    if response.status >= 400:
+                        print(f"Webhook for job {job.id} returned HTTP {response.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Webhook for job {job.id} failed: {e}")
+
+    def _expire(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished < cutoff]:
+            del self.jobs[job_id]
@@ -0,0 +1,92 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from batching import MicroBatcher
+from tiling import tiled_forward
+
+
+class Lane:
+    """One inference queue with its own threads, batching policy and latency record.
+
+    Images that fit in a single tile go through the lane's micro-batcher,
+    larger ones are tiled on the lane's executor. Giving small and large
+    inputs separate lanes keeps thumbnails from queueing behind multi-megapixel
+    images on the same model. Lanes sharing a device pass the same
+    `device_lock` so only one of them runs the model at a time; a tiled
+    image takes it per tile, letting small batches in between.
+    """
+
+    def __init__(self, name, engine, scale, tile, overlap, workers=1, max_batch_size=8, max_wait_ms=5,
+                 bucket=64, window=1000, device_lock=None, pow2_batches=False):
+        self.name = name
+        self.engine = engine
+        self.device_lock = device_lock or contextlib.nullcontext()
+        self.scale = scale
+        self.tile = tile
+        self.overlap = overlap
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix=f'lane-{name}')
+        self.batcher = MicroBatcher(
+            self.forward, scale, max_batch_size, max_wait_ms, bucket, self.executor,
+            max_batch_pixels=tile * tile, pow2_batches=pow2_batches,
+        )
+        self.latencies = deque(maxlen=window)
+        self.inflight = 0
+
+    async def upscale(self, image_tensor):
+        # a (3, H*s, W*s) tensor, or for tiled inputs the finished RGB image
+        _, _, height, width = image_tensor.shape
+        if max(height, width) <= self.tile:
+            return await self.batcher.submit(image_tensor)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, tiled_forward, self.forward, image_tensor, self.scale, self.tile, self.overlap
+        )
+
+    def forward(self, batch):
+        with self.device_lock:
+            return self.engine(batch)
+
+    @contextlib.contextmanager
+    def request(self, start=None):
+        # with `start` taken when the request arrived, the recorded latency
+        # also covers the download and decode
+        self.inflight += 1
+        start = start or time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self.latencies.append(time.perf_counter() - start)
+
+    def stats(self):
+        ordered = sorted(self.latencies)
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else None
+        return {
+            'requests': len(ordered),
+            'inflight': self.inflight,
+            'p50_ms': pick(0.5),
+            'p90_ms': pick(0.9),
+            'p99_ms': pick(0.99),
+            'batcher': self.batcher.stats(),
+        }
+
+
+class Router:
+    """Sends inputs with more than `split_pixels` pixels to the large lane."""
+
+    def __init__(self, small, large, split_pixels):
+        self.small = small
+        self.large = large
+        self.split_pixels = split_pixels
+
+    def lane_for(self, width, height):
+        return self.large if width * height > self.split_pixels else self.small
+
+    @property
+    def lanes(self):
+        return (self.small, self.large)
+
+    def stats(self):
+        return {'split_pixels': self.split_pixels, **{lane.name: lane.stats() for lane in self.lanes}}
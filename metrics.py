@@ -0,0 +1,99 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+stage_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# nested stats keyed by caller-supplied names; exported as a count so the
+# label set stays bounded
+counted = {'clients'}
+
+
+def configure_tracing(endpoint, service_name='esrgan'):
+    """OpenTelemetry tracer exporting over OTLP/HTTP to `endpoint`, e.g. a local collector."""
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    provider = TracerProvider(resource=Resource.create({'service.name': service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+    return provider.get_tracer('esrgan')
+
+
+class StatsCollector:
+    """Exposes the stats() dicts of the service's components as gauges at scrape time.
+
+    Numbers become `esrgan_<component>_<key>`; one level of nested dicts
+    (job states, batch sizes) becomes a `key` label, except those in
+    `counted` (per-client pixels), which become the number of entries.
+    """
+
+    def __init__(self, components):
+        self.components = components
+
+    def collect(self):
+        for component, stats in self.components.items():
+            for name, value in stats().items():
+                metric = f"esrgan_{component}_{name}"
+                if isinstance(value, dict) and name in counted:
+                    yield GaugeMetricFamily(metric, f"{component} {name}", value=len(value))
+                elif isinstance(value, dict):
+                    family = GaugeMetricFamily(metric, f"{component} {name}", labels=['key'])
+                    for key, v in value.items():
+                        if isinstance(v, (int, float)):
+                            family.add_metric([str(key)], v)
+                    yield family
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield GaugeMetricFamily(metric, f"{component} {name}", value=value)
+
+
+class Metrics:
+    """Per-stage latency histograms and in-flight gauges for the predict path.
+
+    `stage` times a block into esrgan_stage_seconds{stage=...} and, with a
+    tracer, also records it as a span; spans opened inside one another nest,
+    so each request becomes one trace.
+    """
+
+    def __init__(self, tracer=None):
+        self.tracer = tracer
+        self.registry = CollectorRegistry()
+        self.stage_seconds = Histogram(
+            'esrgan_stage_seconds', "Time spent in each predict stage", ['stage'],
+            buckets=stage_buckets, registry=self.registry,
+        )
+        self.inflight = Gauge('esrgan_inflight', "Calls currently inside each stage", ['stage'], registry=self.registry)
+        self.requests = Counter('esrgan_requests_total', "predict calls by outcome", ['outcome'], registry=self.registry)
+        self.megapixels = Counter(
+            'esrgan_output_megapixels_total', "Output megapixels produced by inference", registry=self.registry
+        )
+
+    @contextmanager
+    def stage(self, name, **attributes):
+        span = self.tracer.start_as_current_span(name, attributes=attributes) if self.tracer else nullcontext()
+        inflight = self.inflight.labels(name)
+        inflight.inc()
+        start = time.perf_counter()
+        try:
+            with span:
+                yield
+        finally:
+            self.stage_seconds.labels(name).observe(time.perf_counter() - start)
+            inflight.dec()
+
+    def watch(self, **components):
+        # components map a name to a zero-argument stats() callable
+        self.registry.register(StatsCollector(components))
+
+    def serve(self, port, addr='0.0.0.0'):
+        # text/plain on http://addr:port/metrics from a daemon thread; a port
+        # already taken (say by the service next to a bulk run) only costs metrics
+        try:
+            return start_http_server(port, addr, registry=self.registry)
+        except OSError as e:
+            print(f"Error: metrics not served on port {port}: {e}")
+
+    def render(self):
+        return generate_latest(self.registry).decode()
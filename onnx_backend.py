@@ -0,0 +1,97 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+from engine import Engine, load_model, load_reference, accuracy_report
+
+
+def export_onnx(realesrgan, path, opset=17):
+    model = realesrgan.model.eval()
+    example = torch.rand(1, 3, 64, 64, device=realesrgan.device)
+    axes = {0: 'batch', 2: 'height', 3: 'width'}
+    # exported next to the target and moved into place once complete, so a
+    # crash or another process exporting at the same time never leaves a
+    # truncated graph at `path`
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                model, example, tmp, opset_version=opset,
+                input_names=['input'], output_names=['output'],
+                dynamic_axes={'input': axes, 'output': axes},
+            )
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class OnnxEngine:
+    """Drop-in replacement for Engine that runs an exported graph through ONNX Runtime on the CPU."""
+
+    def __init__(self, path, scale, intra_threads=0, inter_threads=0):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_threads
+        options.inter_op_num_threads = inter_threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.path = path
+        self.scale = scale
+        self.precision = 'fp32'
+        self.intra_threads = intra_threads
+        self.inter_threads = inter_threads
+
+    def __call__(self, batch):
+        inputs = np.ascontiguousarray(batch.numpy(), dtype=np.float32)
+        (output,) = self.session.run(None, {'input': inputs})
+        return torch.from_numpy(output).clamp_(0, 1)
+
+    def warmup(self, shapes):
+        # shapes are (batch size, side) pairs
+        start = time.perf_counter()
+        for n, size in shapes:
+            self(torch.rand(n, 3, size, size))
+        return time.perf_counter() - start
+
+    def describe(self):
+        return {
+            'device': 'cpu',
+            'backend': 'onnxruntime',
+            'model': self.path,
+            'precision': self.precision,
+            'intra_threads': self.intra_threads,
+            'inter_threads': self.inter_threads,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the ESRGAN weights to ONNX and check parity with PyTorch")
+    parser.add_argument('--weights', default='models/RealESRGAN_x4plus.pth')
+    parser.add_argument('--output', default='models/RealESRGAN_x4plus.onnx')
+    parser.add_argument('--scale', type=int, default=4)
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--intra-threads', type=int, default=0)
+    parser.add_argument('--inter-threads', type=int, default=0)
+    parser.add_argument('--min-psnr', type=float, default=50.0)
+    args = parser.parse_args()
+
+    realesrgan = load_model(torch.device('cpu'), args.weights, args.scale)
+    export_onnx(realesrgan, args.output, args.opset)
+    print(f"Exported {args.weights} to {args.output}")
+
+    engine = OnnxEngine(args.output, args.scale, args.intra_threads, args.inter_threads)
+    reference = Engine(realesrgan)
+    failed = False
+    for name, result in accuracy_report(engine, reference, load_reference()).items():
+        failed |= result['psnr'] < args.min_psnr
+        print(f"{name:12} {result['psnr']:6.2f} dB vs PyTorch {result['seconds'] * 1000:8.1f} ms")
+    if failed:
+        raise SystemExit(f"ONNX output is below {args.min_psnr} dB PSNR against PyTorch")
+
+
+if __name__ == '__main__':
+    main()
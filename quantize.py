@@ -0,0 +1,121 @@
+import argparse
+import copy
+import json
+import os
+import random
+
+import torch
+from PIL import Image
+from torch.ao.quantization import QConfigMapping, get_default_qconfig
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from convert import image_to_tensor
+from engine import Engine, QuantizedEngine, accuracy_report, load_model, load_reference, psnr, quantized_path
+
+image_suffixes = ('.png', '.jpg', '.jpeg', '.webp', '.bmp')
+
+
+def load_calibration(folder, count, crop):
+    paths = sorted(
+        os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith(image_suffixes)
+    )
+    rng = random.Random(0)
+    rng.shuffle(paths)
+    crops = []
+    for path in paths[:count]:
+        image = Image.open(path).convert('RGB')
+        left = rng.randint(0, max(image.width - crop, 0))
+        top = rng.randint(0, max(image.height - crop, 0))
+        crops.append(image_to_tensor(image.crop((left, top, left + crop, top + crop))))
+    if not crops:
+        raise FileNotFoundError(f"No calibration images found in {folder}")
+    return crops
+
+
+def layer_groups(model):
+    # one group per top-level layer, and one per block of the RRDB trunk
+    for name, child in model.named_children():
+        if isinstance(child, torch.nn.Sequential):
+            for sub, _ in child.named_children():
+                yield f"{name}.{sub}"
+        elif any(True for _ in child.parameters()):
+            yield name
+
+
+def quantize(model, calibration, quantized=None, fp32=()):
+    qconfig = get_default_qconfig('x86')
+    mapping = QConfigMapping()
+    if quantized is None:
+        mapping.set_global(qconfig)
+    for name in quantized or ():
+        mapping.set_module_name(name, qconfig)
+    for name in fp32:
+        mapping.set_module_name(name, None)
+    prepared = prepare_fx(copy.deepcopy(model), mapping, example_inputs=(calibration[0],))
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def sensitive_layers(model, calibration, evaluation, min_psnr):
+    with torch.no_grad():
+        expected = [model(t).clamp(0, 1) for t in evaluation]
+    sensitive = []
+    for name in layer_groups(model):
+        q = quantize(model, calibration, quantized=[name])
+        with torch.no_grad():
+            score = min(psnr(q(t).clamp(0, 1), e) for t, e in zip(evaluation, expected))
+        print(f"{name:16} {score:6.2f} dB")
+        if score < min_psnr:
+            sensitive.append(name)
+    return sensitive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an INT8 ESRGAN generator with post-training static quantization")
+    parser.add_argument('calibration', help="folder of sample images used to calibrate activation ranges")
+    parser.add_argument('--weights', default='models/RealESRGAN_x4plus.pth')
+    parser.add_argument('--output', help="defaults to <weights>_int8.pt next to the weights")
+    parser.add_argument('--scale', type=int, default=4)
+    parser.add_argument('--count', type=int, default=64)
+    parser.add_argument('--crop', type=int, default=128)
+    parser.add_argument('--layer-min-psnr', type=float, default=45.0,
+                        help="layers that alone drop below this are kept in fp32")
+    parser.add_argument('--skip-sensitivity', action='store_true')
+    args = parser.parse_args()
+
+    torch.backends.quantized.engine = 'x86'
+    output = args.output or quantized_path(args.weights)
+    realesrgan = load_model(torch.device('cpu'), args.weights, args.scale)
+    model = realesrgan.model.eval()
+    calibration = load_calibration(args.calibration, args.count, args.crop)
+
+    fp32 = []
+    if not args.skip_sensitivity:
+        fp32 = sensitive_layers(model, calibration, calibration[:8], args.layer_min_psnr)
+    quantized = quantize(model, calibration, fp32=fp32)
+    scripted = torch.jit.freeze(torch.jit.trace(quantized, calibration[0]).eval())
+    torch.jit.save(scripted, output)
+
+    images = load_reference()
+    reference = Engine(realesrgan)
+    baseline = accuracy_report(reference, reference, images)
+    results = accuracy_report(QuantizedEngine(output, args.scale), reference, images)
+    report = {'model': output, 'fp32_layers': fp32, 'images': {}}
+    for name, tensor in images.items():
+        megapixels = tensor.shape[2] * tensor.shape[3] / 1e6
+        report['images'][name] = {
+            'psnr': results[name]['psnr'],
+            'ssim': results[name]['ssim'],
+            'fp32_mpix_per_s': megapixels / baseline[name]['seconds'],
+            'int8_mpix_per_s': megapixels / results[name]['seconds'],
+            'speedup': baseline[name]['seconds'] / results[name]['seconds'],
+        }
+    with open(os.path.splitext(output)[0] + '.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
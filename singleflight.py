@@ -0,0 +1,39 @@
+import asyncio
+
+
+class SingleFlight:
+    """Runs at most one coroutine per key; concurrent callers share its result."""
+
+    def __init__(self):
+        self.inflight = {}
+        self.started = 0
+        self.joined = 0
+
+    def start(self, key, fn):
+        # the task in flight for `key`, started from fn() if there is none
+        task = self.inflight.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(fn())
+            self.inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.joined += 1
+        return task
+
+    def _forget(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+
+    def cancel(self, key, task):
+        # forgotten first, so that callers arriving while it winds down start
+        # a new call instead of joining a cancelled one
+        self._forget(key, task)
+        task.cancel()
+
+    async def do(self, key, fn):
+        # shield so that one caller going away does not cancel the others
+        return await asyncio.shield(self.start(key, fn))
+
+    def stats(self):
+        return {'inflight': len(self.inflight), 'started': self.started, 'joined': self.joined}
@@ -0,0 +1,45 @@
+import pytest
+
+from admission import AdmissionController, Rejected
+
+
+def test_idle_node_admits_an_oversized_request():
+    admission = AdmissionController(100)
+    with admission.slot('a', 500):
+        assert admission.stats()['in_flight_pixels'] == 500
+    assert admission.stats()['in_flight_pixels'] == 0
+
+
+def test_full_node_rejects_with_503():
+    admission = AdmissionController(100)
+    admission.acquire('a', 80)
+    with pytest.raises(Rejected) as e:
+        admission.acquire('b', 40)
+    assert e.value.status == 503
+    assert e.value.retry_after >= admission.min_retry_after
+    assert admission.stats()['rejected'] == {503: 1}
+
+
+def test_client_over_its_share_is_rejected_with_429():
+    admission = AdmissionController(100)
+    admission.acquire('a', 40)
+    admission.acquire('b', 10)
+    # two active clients, 50 each: 'a' asking for 20 more is over its share
+    with pytest.raises(Rejected) as e:
+        admission.acquire('a', 20)
+    assert e.value.status == 429
+    admission.acquire('b', 30)
+    assert admission.stats()['clients'] == {'a': 40, 'b': 40}
+
+
+def test_client_turned_away_still_counts_towards_the_share():
+    admission = AdmissionController(100)
+    admission.acquire('a', 90)
+    with pytest.raises(Rejected):
+        admission.acquire('b', 20)
+    admission.release('a', 90)
+    admission.acquire('a', 30)
+    # 'b' is still waiting, so 'a' only gets half
+    with pytest.raises(Rejected) as e:
+        admission.acquire('a', 30)
+    assert e.value.status == 429
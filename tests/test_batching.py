@@ -0,0 +1,57 @@
+import asyncio
+
+import torch
+import torch.nn.functional as F
+
+from batching import MicroBatcher
+
+
+class Recorder:
+    def __init__(self, scale):
+        self.scale = scale
+        self.shapes = []
+
+    def __call__(self, batch):
+        self.shapes.append(tuple(batch.shape))
+        return F.interpolate(batch, scale_factor=self.scale, mode='nearest')
+
+
+def run(batcher, images):
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(image) for image in images))
+    return asyncio.run(submit_all())
+
+
+def test_each_caller_gets_its_own_crop():
+    torch.manual_seed(0)
+    forward = Recorder(2)
+    batcher = MicroBatcher(forward, 2, max_batch_size=8, max_wait_ms=50, bucket=64)
+    images = [torch.rand(1, 3, h, w) for h, w in [(40, 50), (64, 33), (10, 60)]]
+    outputs = run(batcher, images)
+    assert forward.shapes == [(3, 3, 64, 60)]
+    for image, output in zip(images, outputs):
+        assert torch.equal(output, F.interpolate(image, scale_factor=2, mode='nearest')[0])
+
+
+def test_lone_input_is_not_padded():
+    forward = Recorder(2)
+    batcher = MicroBatcher(forward, 2, max_batch_size=8, max_wait_ms=1, bucket=64)
+    run(batcher, [torch.rand(1, 3, 65, 65)])
+    assert forward.shapes == [(1, 3, 65, 65)]
+
+
+def test_batches_are_capped_by_pixels():
+    forward = Recorder(1)
+    batcher = MicroBatcher(forward, 1, max_batch_size=8, max_wait_ms=50, bucket=64, max_batch_pixels=2 * 64 * 64)
+    run(batcher, [torch.rand(1, 3, 64, 64) for _ in range(4)])
+    assert [shape[0] for shape in forward.shapes] == [2, 2]
+    assert batcher.stats()['images'] == 4
+
+
+def test_padded_engines_get_power_of_two_batches():
+    forward = Recorder(1)
+    batcher = MicroBatcher(forward, 1, max_batch_size=8, max_wait_ms=50, bucket=64,
+                           max_batch_pixels=6 * 128 * 128, pow2_batches=True)
+    assert batcher.batch_limit(128, 128) == 4
+    run(batcher, [torch.rand(1, 3, 128, 128) for _ in range(6)])
+    assert [shape[0] for shape in forward.shapes] == [4, 2]
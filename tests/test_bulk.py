@@ -0,0 +1,79 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+pytest.importorskip('jarvislabs')
+from bulk import Destination, Manifest, Progress, Source, run  # noqa: E402
+from encoding import OutputFormat  # noqa: E402
+
+
+class Service:
+    # the parts of ESRGAN that bulk.run uses, with a 2x nearest upscale
+    def __init__(self):
+        self.codec_pool = ThreadPoolExecutor(2)
+        self.encode_pool = ThreadPoolExecutor(2)
+        self.device = torch.device('cpu')
+        self.upscaled = []
+
+    async def upscale(self, image_tensor):
+        self.upscaled.append(tuple(image_tensor.shape[-2:]))
+        return F.interpolate(image_tensor, scale_factor=2, mode='nearest')[0]
+
+
+@pytest.fixture
+def tree(tmp_path):
+    source = tmp_path / 'in'
+    (source / 'sub').mkdir(parents=True)
+    for name, size in [('a.png', (8, 8)), ('sub/b.png', (6, 4)), ('c.png', (5, 5))]:
+        Image.new('RGB', size, (10, 20, 30)).save(source / name)
+    return tmp_path
+
+
+def bulk(tree, manifest_path, output=None):
+    output = output or OutputFormat('png')
+    source = Source(str(tree / 'in'), None)
+    destination = Destination(str(tree / 'out'), None, output)
+    manifest = Manifest(str(manifest_path), source.location, destination.location, output.tag())
+    service = Service()
+    progress = Progress(100)
+    try:
+        asyncio.run(run(service, source, destination, manifest, 4, progress))
+    finally:
+        manifest.close()
+    return service, progress
+
+
+def test_resume_skips_only_items_done_by_the_same_run(tree):
+    manifest_path = tree / 'manifest.jsonl'
+    service, progress = bulk(tree, manifest_path)
+    assert sorted(service.upscaled) == [(4, 6), (5, 5), (8, 8)]
+    assert Image.open(tree / 'out' / 'sub' / 'b.png').size == (12, 8)
+    entries = [json.loads(line) for line in manifest_path.read_text().splitlines()]
+    assert sorted(e['name'] for e in entries) == ['a.png', 'c.png', 'sub/b.png']
+    assert all(e['destination'] == str(tree / 'out') and e['status'] == 'done' for e in entries)
+
+    # outputs removed, so only the manifest can make the rerun skip them
+    for path in (tree / 'out').rglob('*.png'):
+        path.unlink()
+    service, progress = bulk(tree, manifest_path)
+    assert service.upscaled == []
+    assert progress.skipped == 3
+
+    # another encoding is another run, even with the same names
+    service, progress = bulk(tree, manifest_path, OutputFormat('jpeg'))
+    assert len(service.upscaled) == 3
+    assert (tree / 'out' / 'a.jpg').is_file()
+
+
+def test_existing_outputs_are_skipped(tree):
+    (tree / 'out').mkdir()
+    Image.new('RGB', (1, 1)).save(tree / 'out' / 'a.png')
+    service, progress = bulk(tree, tree / 'manifest.jsonl')
+    assert sorted(service.upscaled) == [(4, 6), (5, 5)]
+    assert progress.skipped == 1
+    assert Image.open(tree / 'out' / 'a.png').size == (1, 1)
@@ -0,0 +1,44 @@
+import os
+
+from PIL import Image
+
+from cache import ResultCache
+
+
+def disk_files(directory):
+    return [os.path.join(root, name) for root, _, files in os.walk(directory) for name in files]
+
+
+def test_hits_from_memory_then_disk(tmp_path):
+    image = Image.new('RGB', (8, 8), (1, 2, 3))
+    cache = ResultCache('model-a', memory_items=10, directory=str(tmp_path))
+    key = cache.key(image, 'png')
+    assert cache.get(key) is None
+    cache.put(key, ['https://example.com/a.png'])
+    assert cache.get(key) == ['https://example.com/a.png']
+
+    reopened = ResultCache('model-a', memory_items=10, directory=str(tmp_path))
+    assert reopened.get(key) == ['https://example.com/a.png']
+    assert reopened.stats()['disk_hits'] == 1
+
+
+def test_key_depends_on_model_variant_and_pixels():
+    cache = ResultCache('model-a')
+    red, blue = Image.new('RGB', (8, 8), (255, 0, 0)), Image.new('RGB', (8, 8), (0, 0, 255))
+    assert cache.key(red) == cache.key(red.copy())
+    assert cache.key(red) != cache.key(blue)
+    assert cache.key(red, 'png') != cache.key(red, 'webp')
+    assert ResultCache('model-b').key(red) != cache.key(red)
+
+
+def test_disk_is_evicted_oldest_first_when_over_size(tmp_path):
+    cache = ResultCache('model-a', memory_items=1, directory=str(tmp_path), disk_bytes=1000)
+    keys = [f"{i:02x}" * 32 for i in range(20)]
+    for i, key in enumerate(keys):
+        cache.put(key, [f"https://example.com/{i}.png" + "x" * 40])
+        os.utime(cache._path(key), (i, i))
+
+    assert sum(os.path.getsize(path) for path in disk_files(tmp_path)) <= 1000
+    assert cache.stats()['disk_bytes'] <= 1000
+    assert cache.get(keys[-1]) is not None
+    assert cache.get(keys[0]) is None
@@ -0,0 +1,41 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from encoding import OutputFormat, available_formats
+
+
+@pytest.mark.parametrize('options, message', [
+    (dict(format='tiff'), "Unsupported output format"),
+    (dict(format='jpeg', quality=101), "quality must be between 0 and 100"),
+    (dict(format='webp', quality=-1), "quality must be between 0 and 100"),
+    (dict(format='png', lossless=True), "lossless is only supported for webp"),
+])
+def test_invalid_options_are_rejected(options, message):
+    with pytest.raises(ValueError, match=message):
+        OutputFormat(**options)
+
+
+def test_unavailable_format_is_rejected(monkeypatch):
+    monkeypatch.setattr(Image, 'SAVE', {k: v for k, v in Image.SAVE.items() if k != 'WEBP'})
+    monkeypatch.setattr(Image, 'init', lambda: None)
+    with pytest.raises(ValueError, match="not available in this Pillow build"):
+        OutputFormat('webp')
+
+
+@pytest.mark.parametrize('name', available_formats())
+def test_every_available_format_encodes(name):
+    output = OutputFormat(name)
+    buffer = BytesIO()
+    Image.new('RGB', (16, 16), (200, 100, 50)).save(buffer, format=output.pil_format, **output.save_options())
+    buffer.seek(0)
+    assert Image.open(buffer).format == output.pil_format
+    assert output.content_type == f"image/{output.pil_format.lower()}"
+
+
+def test_tag_distinguishes_encodings_but_not_threads():
+    assert OutputFormat('jpg').tag() == OutputFormat('jpeg', threads=4).tag()
+    assert OutputFormat('jpeg', quality=80).tag() != OutputFormat('jpeg').tag()
+    assert OutputFormat('webp', lossless=True).tag() != OutputFormat('webp').tag()
+    assert OutputFormat('png', compression=1).tag() == 'png:compress_level=1'
@@ -0,0 +1,118 @@
+import asyncio
+from io import BytesIO
+
+import numpy as np
+from aiohttp import web
+from PIL import Image, ImageFile
+
+from fetch import FetchError, ImageFetcher
+
+
+def encode(image, format='PNG', **options):
+    buffer = BytesIO()
+    image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def fetch_all(fetcher, bodies):
+    # serves `bodies` by name from a local server and fetches each of them
+    async def handle(request):
+        return web.Response(body=bodies[request.match_info['name']])
+
+    async def main():
+        server = web.Application()
+        server.router.add_get('/{name}', handle)
+        runner = web.AppRunner(server)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        results = {}
+        try:
+            for name in bodies:
+                try:
+                    results[name] = await fetcher.fetch(f"http://{host}:{port}/{name}")
+                except FetchError as e:
+                    results[name] = e
+        finally:
+            await fetcher.close()
+            await runner.cleanup()
+        return results
+    return asyncio.run(main())
+
+
+def count_feeds(monkeypatch):
+    feeds = []
+    original_feed = ImageFile.Parser.feed
+    monkeypatch.setattr(ImageFile.Parser, 'feed', lambda self, data: feeds.append(len(data)) or original_feed(self, data))
+    return feeds
+
+
+def test_large_png_is_buffered_once_and_decoded_at_the_end(monkeypatch):
+    pixels = np.random.default_rng(0).integers(0, 256, (1500, 1500, 3), dtype=np.uint8)
+    body = encode(Image.fromarray(pixels), compress_level=1)
+    assert len(body) > 5 * 1024 * 1024
+    feeds = count_feeds(monkeypatch)
+
+    image = fetch_all(ImageFetcher(), {'noise': body})['noise']
+
+    assert np.array_equal(np.asarray(image), pixels)
+    # only the chunks up to the header go through the parser
+    assert sum(feeds) < 1024 * 1024
+
+
+def test_jpeg_is_buffered_after_the_header(monkeypatch):
+    image = Image.new('RGB', (640, 480), (200, 100, 50))
+    body = encode(image, 'JPEG', quality=95)
+    feeds = count_feeds(monkeypatch)
+    result = fetch_all(ImageFetcher(chunk_size=1024), {'photo': body})['photo']
+    assert result.size == (640, 480)
+    assert max(abs(a - b) for a, b in zip(result.getpixel((320, 240)), (200, 100, 50))) <= 2
+    # PIL has no incremental JPEG decoder: only the header went through the parser
+    assert sum(feeds) < len(body)
+
+
+def test_gif_decodes_incrementally(monkeypatch):
+    pixels = np.random.default_rng(0).integers(0, 256, (300, 400), dtype=np.uint8)
+    body = encode(Image.fromarray(pixels, 'L').convert('P'), 'GIF')
+    feeds = count_feeds(monkeypatch)
+    result = fetch_all(ImageFetcher(chunk_size=1024), {'anim': body})['anim']
+    assert np.array_equal(np.asarray(result.convert('L')), np.asarray(Image.open(BytesIO(body)).convert('L')))
+    # every chunk went through the parser's decoder
+    assert sum(feeds) == len(body)
+
+
+def test_probe_rejects_disallowed_formats():
+    image = Image.new('RGB', (32, 32))
+    fetcher = ImageFetcher(formats=['PNG', 'JPEG'])
+    results = fetch_all(fetcher, {
+        'bmp': encode(image, 'BMP'), 'png': encode(image),
+        'mpo': encode(image, 'MPO', save_all=True, append_images=[image]),
+    })
+    assert results['bmp'].code == 'format'
+    assert results['png'].size == results['mpo'].size == (32, 32)
+    assert fetcher.stats()['errors'] == {'format': 1}
+
+
+def test_probe_rejects_oversized_images_from_the_header():
+    pixels = np.random.default_rng(0).integers(0, 256, (1000, 1000, 3), dtype=np.uint8)
+    body = encode(Image.fromarray(pixels), compress_level=0)
+    fetcher = ImageFetcher(max_pixels=500 * 500)
+    result = fetch_all(fetcher, {'big': body})['big']
+    assert result.code == 'too_many_pixels'
+    assert fetcher.stats()['bytes_received'] < len(body) // 10
+
+
+def test_connection_errors_are_counted():
+    fetcher = ImageFetcher(connect_timeout=1)
+
+    async def main():
+        for url in ('http://127.0.0.1:1/missing.png', 'not a url'):
+            try:
+                await fetcher.fetch(url)
+            except FetchError:
+                pass
+        await fetcher.close()
+
+    asyncio.run(main())
+    assert fetcher.stats()['errors'] == {'connection': 1, 'invalid_url': 1}
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from jobs import JobQueue, QueueFull
+
+
+class Handler:
+    # holds every job until released; URLs starting with 'fail' raise
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = []
+
+    async def __call__(self, url):
+        self.started.append(url)
+        await self.release.wait()
+        if url.startswith('fail'):
+            raise ValueError(f"cannot upscale {url}")
+        return [f"{url}.out"]
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_queue_rejects_jobs_beyond_max_depth():
+    async def main():
+        jobs = JobQueue(Handler(), max_depth=2, concurrency=1)
+        jobs.submit('a')
+        await settle()
+        # 'a' is running, so two more fit in the queue
+        jobs.submit('b')
+        jobs.submit('c')
+        with pytest.raises(QueueFull):
+            jobs.submit('d')
+        assert jobs.stats()['jobs'] == {'running': 1, 'queued': 2}
+
+    asyncio.run(main())
+
+
+def test_position_and_eta_while_queued_and_running():
+    async def main():
+        handler = Handler()
+        jobs = JobQueue(handler, concurrency=1)
+        first = jobs.submit('a')['job_id']
+        second = jobs.submit('b')['job_id']
+        assert jobs.status(second)['position'] == 1
+        assert jobs.status(second)['eta_seconds'] is None
+        await settle()
+        assert jobs.status(first)['status'] == 'running'
+        assert jobs.status(second)['position'] == 0
+
+        jobs.mean_seconds = 10.0
+        running = jobs.status(first)
+        assert 0 < running['eta_seconds'] <= 10
+        # one job ahead of it running, then its own run
+        assert jobs.status(second)['eta_seconds'] == pytest.approx(20.0)
+
+        handler.release.set()
+        await settle()
+        assert jobs.status(first)['status'] == jobs.status(second)['status'] == 'done'
+        assert jobs.status(first)['result'] == ['a.out']
+        assert 'position' not in jobs.status(first)
+
+    asyncio.run(main())
+
+
+def test_failed_job_reports_its_error():
+    async def main():
+        handler = Handler()
+        handler.release.set()
+        jobs = JobQueue(handler)
+        job_id = jobs.submit('fail.png')['job_id']
+        await settle()
+        status = jobs.status(job_id)
+        assert status['status'] == 'failed'
+        assert status['error'] == "cannot upscale fail.png"
+        assert status['result'] is None
+        assert status['finished'] >= status['started']
+
+    asyncio.run(main())
+
+
+def test_finished_jobs_expire_after_retention(monkeypatch):
+    async def main():
+        handler = Handler()
+        handler.release.set()
+        jobs = JobQueue(handler, retention=60)
+        old = jobs.submit('a')['job_id']
+        await settle()
+        assert jobs.status(old)['status'] == 'done'
+        finished = jobs.jobs[old].finished
+        monkeypatch.setattr('jobs.time.time', lambda: finished + 61)
+        jobs.submit('b')
+        assert jobs.status(old) is None
+
+    asyncio.run(main())
+
+
+def test_webhook_receives_the_final_state():
+    async def main():
+        received = asyncio.get_running_loop().create_future()
+
+        async def hook(request):
+            received.set_result(await request.json())
+            return web.Response()
+
+        server = web.Application()
+        server.router.add_post('/hook', hook)
+        runner = web.AppRunner(server)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        try:
+            handler = Handler()
+            handler.release.set()
+            jobs = JobQueue(handler)
+            job_id = jobs.submit('a', webhook=f"http://{host}:{port}/hook")['job_id']
+            body = await asyncio.wait_for(received, 5)
+        finally:
+            await runner.cleanup()
+        assert body['job_id'] == job_id
+        assert body['status'] == 'done'
+        assert body['result'] == ['a.out']
+
+    asyncio.run(main())
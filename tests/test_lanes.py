@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from lanes import Lane, Router
+
+
+class Upsampler:
+    # records how many calls overlap
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.overlap = 0
+
+    def __call__(self, batch):
+        with self.lock:
+            self.running += 1
+            self.overlap = max(self.overlap, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+        return F.interpolate(batch, scale_factor=2, mode='nearest')
+
+
+def upscale_both(device_lock):
+    engine = Upsampler()
+    router = Router(
+        Lane('small', engine, 2, 32, 4, workers=2, device_lock=device_lock),
+        Lane('large', engine, 2, 32, 4, workers=2, device_lock=device_lock),
+        32 * 32,
+    )
+
+    async def run():
+        inputs = [torch.rand(1, 3, 16, 16), torch.rand(1, 3, 20, 24), torch.rand(1, 3, 80, 80)]
+        lanes = [router.lane_for(x.shape[3], x.shape[2]) for x in inputs]
+        assert [lane.name for lane in lanes] == ['small', 'small', 'large']
+        outputs = await asyncio.gather(*(lane.upscale(x) for lane, x in zip(lanes, inputs)))
+        # batched inputs come back as tensors, tiled ones as images
+        sizes = [o.size if isinstance(o, Image.Image) else (o.shape[-1], o.shape[-2]) for o in outputs]
+        assert sizes == [(32, 32), (48, 40), (160, 160)]
+
+    asyncio.run(run())
+    return engine.overlap
+
+
+def test_lanes_sharing_a_device_lock_run_one_call_at_a_time():
+    assert upscale_both(threading.Lock()) == 1
+
+
+def test_lanes_without_a_device_lock_run_side_by_side():
+    assert upscale_both(None) > 1
@@ -0,0 +1,49 @@
+import socket
+import urllib.request
+
+from metrics import Metrics
+
+
+def samples(metrics, prefix):
+    return [line for line in metrics.render().splitlines() if line.startswith(prefix)]
+
+
+def test_stats_become_gauges_and_clients_a_count():
+    metrics = Metrics()
+    metrics.watch(admission=lambda: {
+        'in_flight_pixels': 3, 'clients': {f'client-{n}': n for n in range(50)}, 'rejected': {429: 1},
+    })
+    assert samples(metrics, 'esrgan_admission_') == [
+        'esrgan_admission_in_flight_pixels 3.0',
+        'esrgan_admission_clients 50.0',
+        'esrgan_admission_rejected{key="429"} 1.0',
+    ]
+
+
+def test_stage_records_latency_and_inflight():
+    metrics = Metrics()
+    with metrics.stage('fetch'):
+        assert samples(metrics, 'esrgan_inflight{') == ['esrgan_inflight{stage="fetch"} 1.0']
+    assert samples(metrics, 'esrgan_inflight{') == ['esrgan_inflight{stage="fetch"} 0.0']
+    assert 'esrgan_stage_seconds_count{stage="fetch"} 1.0' in samples(metrics, 'esrgan_stage_seconds_count')
+
+
+def test_serve_exposes_the_registry_as_prometheus_text():
+    metrics = Metrics()
+    with metrics.stage('fetch'):
+        pass
+    server, thread = metrics.serve(0, '127.0.0.1')
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+    assert 'esrgan_stage_seconds_count{stage="fetch"} 1.0' in body
+
+
+def test_serve_on_a_taken_port_leaves_metrics_off():
+    with socket.socket() as taken:
+        taken.bind(('127.0.0.1', 0))
+        taken.listen()
+        assert Metrics().serve(taken.getsockname()[1], '127.0.0.1') is None
@@ -0,0 +1,77 @@
+import asyncio
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def main():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do('key', work) for _ in range(5)))
+        return results, flights.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == ['result'] * 5
+    assert len(calls) == 1
+    assert stats == {'inflight': 0, 'started': 1, 'joined': 4}
+
+
+def test_one_caller_cancelling_does_not_cancel_the_others():
+    async def work():
+        await asyncio.sleep(0.02)
+        return 'result'
+
+    async def main():
+        flights = SingleFlight()
+        first = asyncio.ensure_future(flights.do('key', work))
+        second = asyncio.ensure_future(flights.do('key', work))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 'result'
+
+
+def test_errors_reach_every_caller_and_the_key_is_released():
+    async def fail():
+        await asyncio.sleep(0)
+        raise ValueError('boom')
+
+    async def main():
+        flights = SingleFlight()
+        results = await asyncio.gather(flights.do('key', fail), flights.do('key', fail), return_exceptions=True)
+        return results, flights.stats()
+
+    results, stats = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert stats['inflight'] == 0
+
+
+def test_callers_after_a_cancel_start_a_new_call():
+    async def work():
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def main():
+        flights = SingleFlight()
+        first = flights.start('key', work)
+        await asyncio.sleep(0)
+        flights.cancel('key', first)
+        # joins nothing: the cancelled call is already forgotten
+        second = flights.start('key', work)
+        assert second is not first
+        await asyncio.sleep(0.001)
+        # the cancelled call finishing does not drop the new one
+        assert first.cancelled()
+        assert flights.inflight == {'key': second}
+        return await flights.do('key', work), flights.stats()
+
+    result, stats = asyncio.run(main())
+    assert result == 'result'
+    assert stats == {'inflight': 0, 'started': 2, 'joined': 1}
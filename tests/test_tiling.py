@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from tiling import axis_weights, tile_for_budget, tile_starts, tiled_forward
+
+
+def nearest(scale):
+    return lambda batch: F.interpolate(batch, scale_factor=scale, mode='nearest')
+
+
+@pytest.mark.parametrize('length, tile, overlap', [(100, 32, 8), (257, 64, 16), (70, 64, 16), (31, 32, 8), (500, 48, 40)])
+def test_seam_weights_sum_to_one(length, tile, overlap):
+    scale = 4
+    starts = tile_starts(length, tile, overlap)
+    total = torch.zeros(length * scale)
+    for start, w in zip(starts, axis_weights(starts, tile, length, overlap, scale)):
+        total[start * scale:start * scale + len(w)] += w
+    assert torch.allclose(total, torch.ones_like(total))
+
+
+@pytest.mark.parametrize('height, width, tile', [(50, 70, 32), (64, 64, 64), (33, 100, 16)])
+def test_tiled_forward_matches_untiled(height, width, tile):
+    torch.manual_seed(0)
+    image = torch.rand(1, 3, height, width)
+    expected = nearest(4)(image)[0].mul(255).round().to(torch.uint8).permute(1, 2, 0)
+    output = torch.from_numpy(np.array(tiled_forward(nearest(4), image, 4, tile, 8)))
+    assert output.shape == expected.shape
+    assert (output.int() - expected.int()).abs().max() <= 1
+
+
+def test_tile_for_budget_fits_upsampler_maps():
+    budget = 1024 * 1024 * 1024
+    tile = tile_for_budget(budget, 4)
+    # two 64-channel fp32 maps at 4x resolution are alive together
+    assert tile * tile * 16 * 64 * 4 * 2 <= budget
+    assert tile_for_budget(budget // 4, 4) < tile
@@ -0,0 +1,70 @@
+import os
+from io import BytesIO
+
+import boto3
+import pytest
+from moto import mock_aws
+from PIL import Image
+
+from encoding import OutputFormat
+from upload import Uploader, min_part_size
+
+bucket = 'esrgan-test'
+
+
+@pytest.fixture
+def uploader(monkeypatch):
+    for name, value in {'AWS_ACCESS_KEY_ID': 'test', 'AWS_SECRET_ACCESS_KEY': 'test',
+                        'AWS_DEFAULT_REGION': 'us-east-1'}.items():
+        monkeypatch.setenv(name, value)
+    with mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=bucket)
+        uploader = Uploader(bucket, 'out/', region='us-east-1', part_size=min_part_size, concurrency=2)
+        yield uploader
+        uploader.pool.shutdown()
+
+
+def stored(uploader, url):
+    key = url[len(uploader.public_url) + 1:]
+    return uploader.client.get_object(Bucket=bucket, Key=key)
+
+
+def encode(image):
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', **OutputFormat('PNG', compression=0).save_options())
+    return buffer.getvalue()
+
+
+def test_large_image_goes_up_in_parts(uploader):
+    # uncompressed noise: two 5 MiB parts plus a remainder
+    image = Image.frombytes('RGB', (2048, 2048), os.urandom(2048 * 2048 * 3))
+    url = uploader.upload_image(image, OutputFormat('PNG', compression=0), 'large')
+    assert url.endswith('/out/large.png')
+    obj = stored(uploader, url)
+    assert obj['Body'].read() == encode(image)
+    assert obj['ETag'].strip('"').endswith('-3')
+    assert obj['ContentType'] == 'image/png'
+
+
+def test_small_image_is_a_single_put(uploader):
+    image = Image.new('RGB', (64, 64), (10, 20, 30))
+    url = uploader.upload_image(image, OutputFormat('PNG', compression=0))
+    obj = stored(uploader, url)
+    assert obj['Body'].read() == encode(image)
+    assert '-' not in obj['ETag']
+    assert uploader.stats() == {'images': 1, 'bytes_sent': obj['ContentLength']}
+
+
+class FailingImage:
+    # writes more than a part, then fails like an encoder error
+    def save(self, f, **options):
+        f.write(b'\0' * (min_part_size + 1))
+        raise OSError("encoder failed")
+
+
+def test_encoder_failure_aborts_the_multipart_upload(uploader):
+    with pytest.raises(OSError, match="encoder failed"):
+        uploader.upload_image(FailingImage(), OutputFormat('PNG'), 'broken')
+    assert uploader.client.list_multipart_uploads(Bucket=bucket).get('Uploads', []) == []
+    assert uploader.client.list_objects_v2(Bucket=bucket).get('KeyCount') == 0
+    assert uploader.stats() == {'images': 0, 'bytes_sent': 0}
@@ -0,0 +1,71 @@
+import json
+import os
+import struct
+
+import pytest
+import torch
+
+from weights import alignment, ensure_mapped, load_mapped, mapped_path, read_state_dict, save_mapped
+
+
+def test_ensure_mapped_converts_the_checkpoint_once(tmp_path):
+    weight_file = str(tmp_path / 'model.pth')
+    torch.save({'params': {'conv.weight': torch.rand(4, 3, 3, 3)}}, weight_file)
+    path = ensure_mapped(weight_file)
+    assert path == mapped_path(weight_file)
+    assert torch.equal(load_mapped(path)['conv.weight'], torch.load(weight_file)['params']['conv.weight'])
+    modified = os.path.getmtime(path)
+    assert ensure_mapped(weight_file) == path
+    assert os.path.getmtime(path) == modified
+    assert sorted(os.listdir(tmp_path)) == ['model.pth', 'model.tensors']
+
+
+def test_ensure_mapped_needs_the_checkpoint(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ensure_mapped(str(tmp_path / 'missing.pth'))
+
+
+def test_mapped_round_trip(tmp_path):
+    path = str(tmp_path / 'model.tensors')
+    state = {
+        'conv.weight': torch.rand(8, 3, 3, 3),
+        'transposed': torch.rand(5, 7).t(),
+        'odd': torch.rand(3, dtype=torch.float16),
+        'empty': torch.empty(0, 4),
+        'steps': torch.tensor([1, 2, 3], dtype=torch.int64),
+        'half': torch.rand(2, 2, dtype=torch.bfloat16),
+    }
+    assert not state['transposed'].is_contiguous()
+    save_mapped(state, path)
+    loaded = load_mapped(path)
+    assert list(loaded) == list(state)
+    for name, tensor in state.items():
+        assert loaded[name].dtype == tensor.dtype
+        assert loaded[name].shape == tensor.shape
+        assert torch.equal(loaded[name], tensor)
+    assert os.listdir(tmp_path) == ['model.tensors']
+    with open(path, 'rb') as f:
+        (length,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length))
+    # every tensor starts on an aligned offset of an aligned data section
+    assert (8 + length) % alignment == 0
+    assert all(info['offset'] % alignment == 0 for info in header['tensors'].values())
+
+
+def test_load_mapped_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.tensors'
+    header = json.dumps({'format': 'something-else', 'tensors': {}}).encode()
+    path.write_bytes(struct.pack('<Q', len(header)) + header)
+    with pytest.raises(ValueError, match="is not a"):
+        load_mapped(str(path))
+
+
+def test_read_state_dict_prefers_params_over_params_ema(tmp_path):
+    weight_file = str(tmp_path / 'model.pth')
+    params, ema = {'w': torch.zeros(2)}, {'w': torch.ones(2)}
+    torch.save({'params_ema': ema, 'params': params}, weight_file)
+    assert torch.equal(read_state_dict(weight_file)['w'], params['w'])
+    torch.save({'params_ema': ema}, weight_file)
+    assert torch.equal(read_state_dict(weight_file)['w'], ema['w'])
+    torch.save(params, weight_file)
+    assert torch.equal(read_state_dict(weight_file)['w'], params['w'])
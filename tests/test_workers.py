@@ -0,0 +1,40 @@
+import os
+
+import pytest
+import torch
+
+from workers import WorkerPool
+
+
+class Doubler:
+    # exits the process, like an OOM kill, on a negative input
+    def describe(self):
+        return {'precision': 'fp32'}
+
+    def __call__(self, batch):
+        if batch.sum() < 0:
+            os._exit(9)
+        return batch * 2
+
+
+def test_dead_worker_fails_its_calls_and_is_replaced():
+    pool = WorkerPool(Doubler, 1, threads_per_worker=1, poll_interval=0.05)
+    try:
+        with pytest.raises(RuntimeError, match="exited with code 9"):
+            pool(-torch.ones(1, 3, 4, 4))
+        assert torch.equal(pool(torch.ones(1, 3, 4, 4)), torch.full((1, 3, 4, 4), 2.0))
+        assert pool.respawns == 1
+    finally:
+        pool.close()
+
+
+def test_dead_workers_leave_routing_once_respawns_run_out():
+    pool = WorkerPool(Doubler, 2, threads_per_worker=1, max_respawns=0, poll_interval=0.05)
+    try:
+        with pytest.raises(RuntimeError):
+            pool(-torch.ones(1, 3, 4, 4))
+        for _ in range(3):
+            assert torch.equal(pool(torch.ones(1, 3, 4, 4)), torch.full((1, 3, 4, 4), 2.0))
+        assert sum(w.alive for w in pool.workers) == 1
+    finally:
+        pool.close()
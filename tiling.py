@@ -0,0 +1,111 @@
+import math
+
+import torch
+from PIL import Image
+
+
+def tile_starts(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    step = (length - tile) / (count - 1)
+    return [round(i * step) for i in range(count)]
+
+
+def axis_weights(starts, tile, length, overlap, scale):
+    # One 1-D weight ramp per tile along an axis. Neighbouring ramps are
+    # complementary across the seam, so overlapping tiles always sum to 1.
+    steps = [b - a for a, b in zip(starts, starts[1:])]
+    if len(steps) > 1:
+        # keep a tile's leading and trailing seams from running into each other
+        overlap = min(overlap, min(steps) - 1)
+    weights = []
+    for i, start in enumerate(starts):
+        end = min(start + tile, length)
+        w = torch.ones((end - start) * scale)
+        if i > 0:
+            lo, hi = _seam(starts[i - 1], start, tile, length, overlap)
+            ramp = _ramp(hi - lo, scale)
+            w[: (lo - start) * scale] = 0
+            w[(lo - start) * scale:(hi - start) * scale] = ramp
+        if i < len(starts) - 1:
+            lo, hi = _seam(start, starts[i + 1], tile, length, overlap)
+            ramp = 1 - _ramp(hi - lo, scale)
+            w[(lo - start) * scale:(hi - start) * scale] = ramp
+            w[(hi - start) * scale:] = 0
+        weights.append(w)
+    return weights
+
+
+def _seam(prev_start, start, tile, length, overlap):
+    shared = min(prev_start + tile, length) - start
+    width = min(shared, overlap)
+    lo = start + (shared - width) // 2
+    return lo, lo + width
+
+
+def _ramp(width, scale):
+    n = width * scale
+    return (torch.arange(n, dtype=torch.float32) + 0.5) / max(n, 1)
+
+
+def tile_for_budget(budget_bytes, scale, features=64, bytes_per_value=4):
+    # Peak activation memory of RRDBNet per input pixel. The upsampler holds
+    # two `features`-channel maps at the output resolution at once (the
+    # interpolated map and the conv on it) next to the map at half that
+    # resolution it came from; the trunk's maps at input resolution are small
+    # next to those.
+    per_pixel = bytes_per_value * features * (2 * scale * scale + (scale // 2) ** 2 + 2)
+    side = int(math.sqrt(budget_bytes / per_pixel))
+    return max(32, side - side % 8)
+
+
+def tiled_forward(forward, image_tensor, scale, tile, overlap):
+    """Upscale a (1, 3, H, W) tensor tile by tile into an RGB PIL image.
+
+    Only one row band of float accumulators is held at a time, and each band
+    is pasted into the output image as soon as no later tile can touch it.
+    Besides the model's activations for one tile, memory is one band and the
+    output image itself, which is the only full-size copy: it is handed on
+    to the encoder as it is.
+    """
+    _, channels, height, width = image_tensor.shape
+    overlap = min(overlap, tile // 2)
+    ys = tile_starts(height, tile, overlap)
+    xs = tile_starts(width, tile, overlap)
+    wy = axis_weights(ys, tile, height, overlap, scale)
+    wx = axis_weights(xs, tile, width, overlap, scale)
+
+    output = Image.new('RGB', (width * scale, height * scale))
+    band = None
+    band_top = 0
+    for i, y in enumerate(ys):
+        y_end = min(y + tile, height)
+        if band is None:
+            band = torch.zeros((channels, (y_end - y) * scale, width * scale))
+            band_top = y
+        else:
+            # flush the rows no later tile can touch, keep the shared seam rows
+            keep = (band_top + band.shape[1] // scale) - y
+            done = band.shape[1] - keep * scale
+            _store(output, band[:, :done], band_top * scale)
+            grown = torch.zeros((channels, (y_end - y) * scale, width * scale))
+            grown[:, : keep * scale] = band[:, done:]
+            band, band_top = grown, y
+        row_offset = (y - band_top) * scale
+        for j, x in enumerate(xs):
+            x_end = min(x + tile, width)
+            with torch.no_grad():
+                sr = forward(image_tensor[:, :, y:y_end, x:x_end])[0].float().cpu()
+            weight = wy[i][:, None] * wx[j][None, :]
+            rows = slice(row_offset, row_offset + sr.shape[1])
+            cols = slice(x * scale, x * scale + sr.shape[2])
+            band[:, rows, cols].add_(sr.mul_(weight))
+            del sr
+    _store(output, band, band_top * scale)
+    return output
+
+
+def _store(output, band, top):
+    rows = band.clamp_(0, 1).mul_(255).round_().to(torch.uint8).permute(1, 2, 0).contiguous()
+    output.paste(Image.frombytes('RGB', (rows.shape[1], rows.shape[0]), rows.numpy()), (0, top))
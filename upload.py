@@ -0,0 +1,134 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+from encoding import OutputFormat
+
+min_part_size = 5 * 1024 * 1024
+
+
+class MultipartWriter:
+    """File-like sink that turns encoder output into concurrently uploaded multipart parts.
+
+    Nothing is sent to S3 until the first part fills up; if the encoder
+    finishes before that, `close` falls back to a single put_object.
+    """
+
+    def __init__(self, uploader, key, content_type):
+        self.uploader = uploader
+        self.key = key
+        self.content_type = content_type
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        if len(self.buffer) >= self.uploader.part_size:
+            self._send_part()
+        return len(data)
+
+    def _send_part(self):
+        s3 = self.uploader.client
+        if self.upload_id is None:
+            self.upload_id = s3.create_multipart_upload(
+                Bucket=self.uploader.bucket, Key=self.key, ContentType=self.content_type
+            )['UploadId']
+        number = len(self.parts) + 1
+        body = bytes(self.buffer)
+        self.buffer.clear()
+        self.uploader.acquire()
+        future = self.uploader.pool.submit(
+            s3.upload_part, Bucket=self.uploader.bucket, Key=self.key,
+            UploadId=self.upload_id, PartNumber=number, Body=body,
+        )
+        future.add_done_callback(lambda _: self.uploader.release())
+        self.parts.append((number, future))
+
+    def close(self):
+        s3 = self.uploader.client
+        if self.upload_id is None:
+            s3.put_object(Bucket=self.uploader.bucket, Key=self.key, Body=bytes(self.buffer),
+                          ContentType=self.content_type)
+            return
+        if self.buffer:
+            self._send_part()
+        parts = [{'PartNumber': n, 'ETag': f.result()['ETag']} for n, f in self.parts]
+        s3.complete_multipart_upload(
+            Bucket=self.uploader.bucket, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={'Parts': parts},
+        )
+
+    def abort(self):
+        if self.upload_id is not None:
+            for _, future in self.parts:
+                future.cancel()
+            self.uploader.client.abort_multipart_upload(
+                Bucket=self.uploader.bucket, Key=self.key, UploadId=self.upload_id
+            )
+
+    # PIL probes the output file for these
+    def flush(self):
+        pass
+
+    def tell(self):
+        return self.size
+
+
+class Uploader:
+    """Shared S3 client that streams encoded images up as they are produced.
+
+    Encoding runs on the caller's thread and writes into a MultipartWriter;
+    every full part is handed to a pool of upload threads, so network transfer
+    overlaps with the rest of the encode. `max_buffered_parts` bounds how many
+    parts can be waiting in memory at once across all uploads.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, public_url=None,
+                 part_size=8 * 1024 * 1024, concurrency=8, max_buffered_parts=16):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = max(part_size, min_part_size)
+        config = Config(max_pool_connections=concurrency, retries={'max_attempts': 3, 'mode': 'adaptive'})
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region, config=config)
+        self.pool = ThreadPoolExecutor(concurrency, thread_name_prefix='upload')
+        self.slots = threading.BoundedSemaphore(max_buffered_parts)
+        self.lock = threading.Lock()
+        self.uploads = 0
+        self.bytes_sent = 0
+        if public_url:
+            self.public_url = public_url.rstrip('/')
+        elif endpoint_url:
+            self.public_url = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self.public_url = f"https://{bucket}.s3.amazonaws.com"
+
+    def acquire(self):
+        self.slots.acquire()
+
+    def release(self):
+        self.slots.release()
+
+    def upload_image(self, image, output=None, key=None):
+        output = output or OutputFormat()
+        key = f"{self.prefix}{key or uuid.uuid4().hex}.{output.extension}"
+        writer = MultipartWriter(self, key, output.content_type)
+        try:
+            image.save(writer, format=output.pil_format, **output.save_options())
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        with self.lock:
+            self.uploads += 1
+            self.bytes_sent += writer.size
+        return f"{self.public_url}/{key}"
+
+    def stats(self):
+        with self.lock:
+            return {'images': self.uploads, 'bytes_sent': self.bytes_sent}
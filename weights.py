@@ -0,0 +1,118 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import warnings
+
+import torch
+
+# File layout: an 8-byte little-endian header length, a JSON header mapping
+# tensor names to dtype/shape/offset, then the raw tensor bytes, each aligned
+# to `alignment` so they can be viewed in place from a shared mapping.
+magic = 'esrgan-mmap-v1'
+alignment = 64
+dtypes = {
+    'float32': torch.float32, 'float16': torch.float16, 'bfloat16': torch.bfloat16,
+    'int64': torch.int64, 'int32': torch.int32, 'uint8': torch.uint8,
+}
+
+
+def mapped_path(weight_file):
+    root, _ = os.path.splitext(weight_file)
+    return f"{root}.tensors"
+
+
+def read_state_dict(weight_file):
+    # same key order as RealESRGAN.load_weights, so the mapped copy holds
+    # exactly the weights the checkpoint path would load
+    state = torch.load(weight_file, map_location='cpu')
+    for key in ('params', 'params_ema'):
+        if key in state:
+            return state[key]
+    return state
+
+
+def save_mapped(state, path):
+    names = {v: k for k, v in dtypes.items()}
+    tensors = {}
+    offset = 0
+    for name, tensor in state.items():
+        nbytes = tensor.numel() * tensor.element_size()
+        tensors[name] = {'dtype': names[tensor.dtype], 'shape': list(tensor.shape), 'offset': offset}
+        offset += -(-nbytes // alignment) * alignment
+    header = json.dumps({'format': magic, 'tensors': tensors}).encode()
+    header += b' ' * (-(len(header) + 8) % alignment)
+    # per-process temporary name: several processes may write the same file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            start = f.tell()
+            for name, tensor in state.items():
+                f.seek(start + tensors[name]['offset'])
+                if tensor.numel():
+                    f.write(tensor.detach().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes())
+            f.truncate(start + offset)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def ensure_mapped(weight_file):
+    """Path of the mapped copy of `weight_file`, converting the checkpoint first if there is none."""
+    path = mapped_path(weight_file)
+    if os.path.isfile(path):
+        return path
+    if not os.path.isfile(weight_file):
+        raise FileNotFoundError(f"Model weights not found at {weight_file}")
+    try:
+        save_mapped(read_state_dict(weight_file), path)
+    except OSError as e:
+        raise RuntimeError(f"Could not write the shared weight file {path}: {e}") from e
+    print(f"Wrote shared weights to {path}")
+    return path
+
+
+def load_mapped(path):
+    """Returns a state dict whose tensors are read-only views of a shared mapping of `path`."""
+    with open(path, 'rb') as f:
+        (length,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length))
+        if header.get('format') != magic:
+            raise ValueError(f"{path} is not a {magic} weight file")
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    start = 8 + length
+    state = {}
+    for name, info in header['tensors'].items():
+        dtype = dtypes[info['dtype']]
+        count = 1
+        for dim in info['shape']:
+            count *= dim
+        if count == 0:
+            state[name] = torch.empty(info['shape'], dtype=dtype)
+            continue
+        # the mapping is read-only; inference never writes to parameters
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='The given buffer is not writable')
+            flat = torch.frombuffer(buffer, dtype=dtype, count=count, offset=start + info['offset'])
+        state[name] = flat.view(info['shape'])
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a .pth checkpoint to the memory-mapped weight format")
+    parser.add_argument('weights', nargs='?', default='models/RealESRGAN_x4plus.pth')
+    parser.add_argument('--output', help="defaults to <weights>.tensors next to the checkpoint")
+    args = parser.parse_args()
+
+    output = args.output or mapped_path(args.weights)
+    state = read_state_dict(args.weights)
+    save_mapped(state, output)
+    print(f"Wrote {len(state)} tensors from {args.weights} to {output}")
+
+
+if __name__ == '__main__':
+    main()
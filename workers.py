@@ -0,0 +1,181 @@
+import itertools
+import os
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+import torch
+import torch.multiprocessing as mp
+
+
+def _serve(make_engine, cores, inbox, results):
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    engine = make_engine()
+    while True:
+        message = inbox.get()
+        if message is None:
+            return
+        job_id, method, args = message
+        try:
+            results.send((job_id, getattr(engine, method)(*args), None))
+        except Exception as e:
+            results.send((job_id, None, f"{type(e).__name__}: {e}"))
+
+
+class Worker:
+    def __init__(self, index, process, inbox, results, cores):
+        self.index = index
+        self.process = process
+        self.inbox = inbox
+        self.results = results
+        self.cores = cores
+        self.outstanding = 0
+        self.alive = True
+
+
+class WorkerPool:
+    """Inference processes, each pinned to its own slice of cores.
+
+    Workers are started through a forkserver, never forked from the calling
+    process: the pool is built (and workers respawned) from background
+    threads, and forking a threaded process can leave a child holding a lock
+    it will never get back. `make_engine` is pickled to every child and
+    builds its engine there; weights loaded from a mapped file share the
+    page cache between them. Calls are dispatched to the worker with the
+    least outstanding work, counted in input pixels, and block the calling
+    thread until the result comes back.
+
+    A worker that exits (e.g. OOM-killed) is noticed through its process
+    sentinel; the calls it was running fail and it is replaced. After
+    `max_respawns` replacements across the pool, dead workers are left out
+    of routing instead.
+    """
+
+    def __init__(self, make_engine, processes, threads_per_worker=0, max_respawns=10, poll_interval=0.5):
+        self.ctx = mp.get_context('forkserver')
+        self.ctx.set_forkserver_preload(['torch'])
+        self.make_engine = make_engine
+        self.max_respawns = max_respawns
+        self.poll_interval = poll_interval
+        self.respawns = 0
+        self.closed = False
+        cores = sorted(os.sched_getaffinity(0))
+        per_worker = threads_per_worker or max(1, len(cores) // processes)
+        self.workers = []
+        for i in range(processes):
+            slice_ = cores[i * per_worker:(i + 1) * per_worker] or cores[-per_worker:]
+            self.workers.append(self._start(i, slice_))
+        self.ids = itertools.count()
+        self.pending = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self._collect, name='worker-results', daemon=True).start()
+        info = self.call(self.workers[0], 'describe')
+        self.precision = info['precision']
+
+    def _start(self, index, cores):
+        # every worker answers on its own pipe: a worker that dies halfway
+        # through a write cannot block the others
+        inbox = self.ctx.Queue()
+        results, writer = self.ctx.Pipe(duplex=False)
+        process = self.ctx.Process(
+            target=_serve, args=(self.make_engine, cores, inbox, writer),
+            name=f'esrgan-worker-{index}', daemon=True,
+        )
+        process.start()
+        writer.close()
+        return Worker(index, process, inbox, results, cores)
+
+    def _collect(self):
+        while not self.closed:
+            with self.lock:
+                workers = [w for w in self.workers if w.alive]
+            ready = wait(
+                [w.results for w in workers] + [w.process.sentinel for w in workers], timeout=self.poll_interval
+            )
+            for worker in workers:
+                # take what it sent before it exited, then handle the exit
+                while worker.results in ready and worker.results.poll():
+                    try:
+                        self._finish(*worker.results.recv())
+                    except EOFError:
+                        break
+                if worker.process.sentinel in ready:
+                    self._reap(worker)
+
+    def _finish(self, job_id, result, error):
+        with self.lock:
+            entry = self.pending.pop(job_id, None)
+            if entry is not None:
+                entry[1].outstanding -= entry[2]
+        if entry is None:
+            return
+        future, worker, _ = entry
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(RuntimeError(f"worker {worker.index}: {error}"))
+
+    def _reap(self, worker):
+        worker.process.join()
+        with self.lock:
+            if self.closed:
+                return
+            worker.alive = False
+            lost = [
+                (job_id, future) for job_id, (future, owner, _) in self.pending.items() if owner is worker
+            ]
+            for job_id, _ in lost:
+                del self.pending[job_id]
+            if self.respawns < self.max_respawns:
+                self.respawns += 1
+                self.workers[worker.index] = self._start(worker.index, worker.cores)
+        worker.results.close()
+        for _, future in lost:
+            future.set_exception(RuntimeError(f"worker {worker.index} exited with code {worker.process.exitcode}"))
+
+    def submit(self, worker, method, *args, work=0):
+        future = Future()
+        with self.lock:
+            if worker is None:
+                alive = [w for w in self.workers if w.alive]
+                if not alive:
+                    raise RuntimeError("No live worker processes")
+                worker = min(alive, key=lambda w: w.outstanding)
+            elif not worker.alive:
+                raise RuntimeError(f"worker {worker.index} is not running")
+            job_id = next(self.ids)
+            self.pending[job_id] = (future, worker, work)
+            worker.outstanding += work
+        worker.inbox.put((job_id, method, args))
+        return future
+
+    def call(self, worker, method, *args):
+        return self.submit(worker, method, *args).result()
+
+    def __call__(self, batch):
+        n, _, h, w = batch.shape
+        return self.submit(None, '__call__', batch, work=n * h * w).result()
+
+    def warmup(self, shapes):
+        futures = [self.submit(w, 'warmup', shapes) for w in self.workers if w.alive]
+        return max(f.result() for f in futures)
+
+    def describe(self):
+        with self.lock:
+            outstanding = [w.outstanding for w in self.workers]
+        return {
+            **self.call(None, 'describe'),
+            'workers': [
+                {'pid': w.process.pid, 'cores': w.cores, 'outstanding_pixels': o, 'alive': w.process.is_alive()}
+                for w, o in zip(self.workers, outstanding)
+            ],
+            'respawns': self.respawns,
+        }
+
+    def close(self):
+        self.closed = True
+        for w in self.workers:
+            w.inbox.put(None)
+        for w in self.workers:
+            w.process.join(timeout=5)